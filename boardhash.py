@@ -0,0 +1,166 @@
+"""
+Canonical fingerprints of Dollar Game boards, to find and drop isomorphic duplicates
+
+Two boards are the same game if their graphs are isomorphic with the dollar amounts matching up,
+no matter how the nodes are numbered or placed. fingerprint() hashes a board by Weisfeiler-Lehman colour refinement:
+every node starts coloured by its dollar amount and is repeatedly recoloured by its colour and the colours of its
+neighbours, until the colouring is stable. Isomorphic boards always get the same fingerprint. Different boards
+practically always get different ones, but for some (regular) graphs they might not, so BoardIndex checks boards with
+equal fingerprints with an exact isomorphism test before calling them duplicates.
+
+BoardIndex keeps the fingerprints (and one board per fingerprint for the exact test) in a dbm file,
+so a bulk pipeline checks each board in O(1) index lookups across runs:
+
+   python boardhash.py --index boards.idx boards/*.json
+"""
+
+import sys, dbm, pickle, hashlib, argparse
+import boardio
+
+# boards as dense lists: dollars per node and neighbour lists,
+# from model.nodes (node id: [(x,y), dollars]) and model.edges, an edge given twice counts twice like in the game
+def normalize(nodes, edges):
+    ids = {nodeid: i for (i, nodeid) in enumerate(sorted(nodes))}
+    dollars = [nodes[nodeid][1] for nodeid in sorted(nodes)]
+    neighbours = [[] for amount in dollars]
+    for (node1, node2) in edges:
+        neighbours[ids[node1]].append(ids[node2])
+        neighbours[ids[node2]].append(ids[node1])
+    return (dollars, neighbours)
+
+def fromboard(board):
+    return ({nodeid: [position, amount] for (nodeid, (position, amount)) in enumerate(zip(board.positions, board.amounts))}, board.edges)
+
+# stable colouring: colours are numbered by sorting their signatures, so the numbers don't depend on node order
+def refine(dollars, neighbours):
+    signatures = [(amount,) for amount in dollars]
+    colours = None
+    classes = 0
+    history = []
+    while True:
+        numbers = {signature: number for (number, signature) in enumerate(sorted(set(signatures)))}
+        colours = [numbers[signature] for signature in signatures]
+        history.append(sorted(numbers))
+        if len(numbers)==classes:
+           # no class got split, the colouring is stable
+           return (colours, history)
+        classes = len(numbers)
+        signatures = [(colours[node], tuple(sorted(colours[neighbour] for neighbour in neighbours[node])))
+                      for node in range(len(dollars))]
+
+def fingerprint(nodes, edges):
+    return digest(normalize(nodes, edges))
+
+# fingerprint of a board already normalized
+def digest(board):
+    (dollars, neighbours) = board
+    (colours, history) = refine(dollars, neighbours)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((len(dollars), sum(map(len, neighbours)), history, sorted(colours))).encode())
+    return digest.hexdigest()
+
+# exact test: map the nodes of one board onto the other node by node, only onto nodes of the same stable colour,
+# backtracking as soon as an edge (with its multiplicity) doesn't match
+def isomorphic(board1, board2):
+    (dollars1, neighbours1) = board1
+    (dollars2, neighbours2) = board2
+    if len(dollars1)!=len(dollars2):
+       return False
+    # refining both boards together makes their colour numbers comparable
+    n = len(dollars1)
+    (colours, history) = refine(dollars1+dollars2, neighbours1+[[neighbour+n for neighbour in node] for node in neighbours2])
+    colours1 = colours[:n]
+    colours2 = colours[n:]
+    if sorted(colours1)!=sorted(colours2):
+       return False
+    candidates = {}
+    for (node, colour) in enumerate(colours2):
+        candidates.setdefault(colour, []).append(node)
+    multiplicity1 = [{} for node in range(n)]
+    multiplicity2 = [{} for node in range(n)]
+    for node in range(n):
+        for neighbour in neighbours1[node]:
+            multiplicity1[node][neighbour] = multiplicity1[node].get(neighbour, 0)+1
+        for neighbour in neighbours2[node]:
+            multiplicity2[node][neighbour] = multiplicity2[node].get(neighbour, 0)+1
+    # smallest colour classes first, they leave the fewest choices
+    order = sorted(range(n), key=lambda node: len(candidates[colours1[node]]))
+    mapping = {}
+    used = set()
+
+    def extend(depth):
+        if depth==n:
+           return True
+        node = order[depth]
+        for image in candidates[colours1[node]]:
+            if image in used:
+               continue
+            if any(multiplicity2[image].get(mapping[neighbour], 0)!=count
+                   for (neighbour, count) in multiplicity1[node].items() if neighbour in mapping):
+               continue
+            if sum(1 for neighbour in multiplicity2[image] if neighbour in used) != \
+               sum(1 for neighbour in multiplicity1[node] if neighbour in mapping):
+               continue
+            mapping[node] = image
+            used.add(image)
+            if extend(depth+1):
+               return True
+            del mapping[node]
+            used.discard(image)
+        return False
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), n+100))
+    return extend(0)
+
+class BoardIndex:
+    def __init__(self, filename):
+        self.db = dbm.open(filename, 'c')
+
+    # add a board, True if it is new, False if an isomorphic board is already in the index
+    def add(self, nodes, edges):
+        board = normalize(nodes, edges)
+        key = digest(board).encode()
+        boards = pickle.loads(self.db[key]) if key in self.db else []
+        for known in boards:
+            if isomorphic(board, known):
+               return False
+        # a new board or (very rarely) a different board with the same fingerprint
+        boards.append(board)
+        self.db[key] = pickle.dumps(boards)
+        return True
+
+    def __contains__(self, board):
+        board = normalize(*board)
+        key = digest(board).encode()
+        if not key in self.db:
+           return False
+        return any(isomorphic(board, known) for known in pickle.loads(self.db[key]))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Find isomorphic duplicates among Dollar Game boards')
+    parser.add_argument('boards', nargs='+', help='board files (any format boardio.py reads)')
+    parser.add_argument('--index', default='boards.idx', help='index file, kept between runs')
+    args = parser.parse_args()
+
+    unique = 0
+    with BoardIndex(args.index) as index:
+         for filename in args.boards:
+             (nodes, edges) = fromboard(boardio.read(filename))
+             if index.add(nodes, edges):
+                unique += 1
+                print('new', filename)
+             else:
+                print('duplicate', filename)
+    print('%d new, %d duplicates' % (unique, len(args.boards)-unique))
+
+if __name__ == '__main__':
+    main()
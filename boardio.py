@@ -0,0 +1,270 @@
+"""
+Reading and writing Dollar Game boards in standard graph formats
+
+Supported formats (chosen by file extension, a trailing .gz means gzip compressed):
+- edge list (.txt, .edges, .el, .csv, .tsv): one edge per line as two vertex labels, separated by whitespace or commas,
+  further columns (like weights) are ignored, lines starting with # or % are comments
+- DIMACS (.dimacs, .col, .gr): "p edge N M" then "e u v" lines (or "a u v w" arcs),
+  optionally "n id dollars" for the dollar amounts and "v id x y" for node positions
+- GraphML (.graphml): nodes, edges and the node data keys x, y and dollars
+- JSON board (.json, .jsonl): one JSON object per line, a header {"dollargame": 1} followed by
+  {"node": label, "x": x, "y": y, "dollars": dollars} (all but node optional) and {"edge": [label1, label2]} lines
+- the game's own save file (.sav)
+
+Files are read line by line (GraphML element by element, dropping each element once read),
+so even datasets with millions of edges never get loaded as a whole. Vertex labels can be anything,
+they are mapped to dense node ids 0..n-1 in order of appearance. Self loops are dropped, multiple edges merged.
+
+Run "python boardio.py INPUT OUTPUT" to convert a board from one format to another.
+"""
+
+import sys, os, gzip, json, pickle
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+# Board as read from a file: positions (or None) and dollar amounts by node id, edges as (id1, id2) with id1<id2.
+# The edges are kept as single numbers id1<<32|id2, which takes a third of the memory of a set of tuples.
+class Board:
+    def __init__(self):
+        self.ids = {} # label: node id
+        self.positions = []
+        self.amounts = []
+        self.edgekeys = set()
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @property
+    def edges(self):
+        return {(key>>32, key&0xffffffff) for key in self.edgekeys}
+
+    def node(self, label, position=None, amount=None):
+        nodeid = self.ids.get(label)
+        if nodeid is None:
+           nodeid = len(self.amounts)
+           self.ids[label] = nodeid
+           self.positions.append(None)
+           self.amounts.append(0)
+        if not position is None:
+           self.positions[nodeid] = position
+        if not amount is None:
+           self.amounts[nodeid] = amount
+        return nodeid
+
+    def edge(self, label1, label2):
+        node1 = self.node(label1)
+        node2 = self.node(label2)
+        if node1 != node2:
+           self.edgekeys.add(min(node1,node2)<<32 | max(node1,node2))
+
+def number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+def openfile(filename, mode):
+    if filename.endswith('.gz'):
+       return gzip.open(filename, mode+'t', encoding='utf-8')
+    return open(filename, mode, encoding='utf-8')
+
+###### edge list
+
+def readedgelist(filename, board):
+    with openfile(filename, 'r') as edgelist:
+         for line in edgelist:
+             if line.startswith(('#','%')):
+                continue
+             labels = line.replace(',',' ').split()
+             if len(labels)>=2:
+                board.edge(labels[0], labels[1])
+             elif len(labels)==1:
+                # a vertex on its own
+                board.node(labels[0])
+
+def writeedgelist(filename, nodes, edges):
+    with openfile(filename, 'w') as edgelist:
+         edgelist.write('# dollargame edge list: node1 node2\n')
+         connected = set()
+         for (node1, node2) in edges:
+             edgelist.write('%d %d\n' % (node1, node2))
+             connected.add(node1)
+             connected.add(node2)
+         # nodes without edges only show up as single labels
+         for (nodeid, node) in nodes:
+             if not nodeid in connected:
+                edgelist.write('%d\n' % nodeid)
+
+###### DIMACS
+
+def readdimacs(filename, board):
+    with openfile(filename, 'r') as dimacs:
+         for line in dimacs:
+             fields = line.split()
+             if not fields or fields[0]=='c':
+                continue
+             if fields[0]=='p':
+                # p edge N M: nodes are numbered 1..N, create all of them in order
+                for label in range(1, int(fields[2])+1):
+                    board.node(str(label))
+             elif fields[0] in ('e','a'):
+                board.edge(fields[1], fields[2])
+             elif fields[0]=='n':
+                board.node(fields[1], amount=int(number(fields[2])))
+             elif fields[0]=='v':
+                board.node(fields[1], position=(number(fields[2]), number(fields[3])))
+
+def writedimacs(filename, nodes, edges):
+    # DIMACS numbers nodes 1..N, so the (possibly sparse) node ids get renumbered
+    nodes = list(nodes)
+    numbers = {nodeid: i+1 for (i, (nodeid, node)) in enumerate(nodes)}
+    with openfile(filename, 'w') as dimacs:
+         dimacs.write('c dollargame board\n')
+         dimacs.write('p edge %d %d\n' % (len(nodes), len(edges)))
+         for (nodeid, (position, amount)) in nodes:
+             dimacs.write('n %d %d\n' % (numbers[nodeid], amount))
+             if not position is None:
+                dimacs.write('v %d %s %s\n' % (numbers[nodeid], position[0], position[1]))
+         for (node1, node2) in edges:
+             dimacs.write('e %d %d\n' % (numbers[node1], numbers[node2]))
+
+###### GraphML
+
+def localname(tag):
+    return tag.rsplit('}',1)[-1]
+
+def readgraphml(filename, board):
+    keys = {} # key id: attribute name
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as graphml:
+         parents = []
+         for (event, element) in ET.iterparse(graphml, events=('start','end')):
+             if event=='start':
+                parents.append(element)
+                continue
+             parents.pop()
+             tag = localname(element.tag)
+             if tag=='key':
+                keys[element.get('id')] = element.get('attr.name', element.get('id'))
+             elif tag=='node':
+                data = {keys.get(child.get('key'), child.get('key')): child.text
+                        for child in element if localname(child.tag)=='data'}
+                position = None
+                if data.get('x') and data.get('y'):
+                   position = (number(data['x']), number(data['y']))
+                amount = data.get('dollars')
+                board.node(element.get('id'), position, None if amount is None else int(number(amount)))
+             elif tag=='edge':
+                board.edge(element.get('source'), element.get('target'))
+             else:
+                continue
+             # read, so drop it (and its siblings read before) from the tree
+             parents[-1].clear()
+
+def writegraphml(filename, nodes, edges):
+    with openfile(filename, 'w') as graphml:
+         graphml.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                       '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                       '  <key id="x" for="node" attr.name="x" attr.type="double"/>\n'
+                       '  <key id="y" for="node" attr.name="y" attr.type="double"/>\n'
+                       '  <key id="dollars" for="node" attr.name="dollars" attr.type="long"/>\n'
+                       '  <graph id="dollargame" edgedefault="undirected">\n')
+         for (nodeid, (position, amount)) in nodes:
+             data = '' if position is None else '<data key="x">%s</data><data key="y">%s</data>' % position
+             graphml.write('    <node id=%s>%s<data key="dollars">%d</data></node>\n'
+                           % (quoteattr('n%d' % nodeid), data, amount))
+         for (node1, node2) in edges:
+             graphml.write('    <edge source="n%d" target="n%d"/>\n' % (node1, node2))
+         graphml.write('  </graph>\n</graphml>\n')
+
+###### JSON board
+
+JSONVERSION = 1
+
+def readjson(filename, board):
+    with openfile(filename, 'r') as lines:
+         for (linenumber, line) in enumerate(lines):
+             if not line.strip():
+                continue
+             record = json.loads(line)
+             if 'node' in record:
+                position = (record['x'], record['y']) if 'x' in record and 'y' in record else None
+                board.node(str(record['node']), position, record.get('dollars'))
+             elif 'edge' in record:
+                board.edge(str(record['edge'][0]), str(record['edge'][1]))
+             elif 'dollargame' in record:
+                if record['dollargame'] != JSONVERSION:
+                   raise ValueError('%s: unknown board version %s' % (filename, record['dollargame']))
+             else:
+                raise ValueError('%s:%d: neither node nor edge' % (filename, linenumber+1))
+
+def writejson(filename, nodes, edges):
+    with openfile(filename, 'w') as lines:
+         lines.write(json.dumps({'dollargame': JSONVERSION})+'\n')
+         for (nodeid, (position, amount)) in nodes:
+             record = {'node': nodeid, 'dollars': amount}
+             if not position is None:
+                (record['x'], record['y']) = position
+             lines.write(json.dumps(record)+'\n')
+         for (node1, node2) in edges:
+             lines.write(json.dumps({'edge': [node1, node2]})+'\n')
+
+###### the game's save file
+
+def readsav(filename, board):
+    with open(filename, 'rb') as savegame:
+         nodes = pickle.load(savegame)
+         edges = pickle.load(savegame)
+    for (nodeid, (position, amount)) in sorted(nodes.items()):
+        board.node(nodeid, position, amount)
+    for (node1, node2) in edges:
+        board.edge(node1, node2)
+
+def writesav(filename, nodes, edges):
+    nodes = {nodeid: [position or (0,0), amount] for (nodeid, (position, amount)) in nodes}
+    with open(filename, 'wb') as savegame:
+         pickle.dump(nodes, savegame)
+         pickle.dump(set(edges), savegame)
+         pickle.dump(max(nodes, default=-1)+1, savegame)
+
+FORMATS = {
+    'edgelist': (readedgelist, writeedgelist),
+    'dimacs'  : (readdimacs, writedimacs),
+    'graphml' : (readgraphml, writegraphml),
+    'json'    : (readjson, writejson),
+    'sav'     : (readsav, writesav)
+}
+EXTENSIONS = {
+    '.txt': 'edgelist', '.edges': 'edgelist', '.el': 'edgelist', '.csv': 'edgelist', '.tsv': 'edgelist',
+    '.dimacs': 'dimacs', '.col': 'dimacs', '.gr': 'dimacs',
+    '.graphml': 'graphml',
+    '.json': 'json', '.jsonl': 'json',
+    '.sav': 'sav'
+}
+
+def formatof(filename, fmt=None):
+    if fmt is None:
+       name = filename[:-3] if filename.endswith('.gz') else filename
+       fmt = EXTENSIONS.get(os.path.splitext(name)[1].lower())
+    if not fmt in FORMATS:
+       raise ValueError('unknown board format for '+filename)
+    return fmt
+
+def read(filename, fmt=None):
+    board = Board()
+    FORMATS[formatof(filename, fmt)][0](filename, board)
+    return board
+
+# nodes as (node id, [(x,y) or None, dollars]) pairs (like model.nodes.items()), edges as (node id, node id) pairs
+def write(filename, nodes, edges, fmt=None):
+    FORMATS[formatof(filename, fmt)][1](filename, nodes, edges)
+
+def main():
+    if len(sys.argv)!=3:
+       print('usage: python boardio.py INPUT OUTPUT')
+       sys.exit(1)
+    board = read(sys.argv[1])
+    # missing positions stay missing, the game places these nodes when loading
+    nodes = enumerate(zip(board.positions, board.amounts))
+    write(sys.argv[2], nodes, board.edges)
+
+if __name__ == '__main__':
+    main()
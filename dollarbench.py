@@ -0,0 +1,200 @@
+"""
+Headless benchmark for the Dollar Game (dollargame.py)
+
+Runs the Controller without a window (SDL dummy video driver), feeds synthetic mouse events
+into the Editor and Game states on boards of different sizes and records the latency of each event
+and each frame. Results are written to a JSON file, which can be compared with an earlier run:
+
+   python dollarbench.py --output new.json --compare old.json
+"""
+
+import os, sys, time, json, math, platform, argparse
+from random import Random
+
+# no window, no sound
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+import pygame as pg
+import dollargame as dg
+
+SIZES = [10, 100, 1000, 10000, 100000]
+SPACING = 3*dg.CIRCLESIZE # world distance between neighbouring nodes of a generated board
+
+# a board of n nodes on a jittered grid, a path through all nodes plus about n/2 edges between near nodes
+def makeboard(model, n, seed):
+    rng = Random(seed)
+    columns = max(1, int(math.sqrt(n*4/3)))
+    model.nodes = {}
+    model.edges = set()
+    for i in range(n):
+        x = (i%columns)*SPACING + rng.randint(-SPACING//4, SPACING//4)
+        y = (i//columns)*SPACING + rng.randint(-SPACING//4, SPACING//4)
+        model.nodes[i] = [(x,y), rng.randint(-3,3)]
+        if i>0:
+           model.edges.add((i-1,i))
+    for i in range(n>>1):
+        n1 = rng.randrange(n)
+        n2 = n1 + rng.choice((1, columns, columns+1))
+        if n2<n:
+           model.edges.add((n1,n2))
+    model.nodeidcounter = n
+    model.layout = None
+    model.invalidate()
+
+# screen positions of nodes visible with the current camera
+def visiblenodes(model):
+    (sw,sh) = dg.SCREENSIZE
+    positions = []
+    for nodeindex in model.spatialindex().nodes(model.camera.viewport()):
+        (x,y) = model.camera.toscreen(model.nodes[nodeindex][0])
+        if 0<=x<sw and 0<=y<sh:
+           positions.append((x,y))
+    return positions
+
+# synthetic input: the mouse moves from node to node (in steps) and sometimes clicks a node,
+# left or right just like a player lending or borrowing.
+# Editor clicks only ever hit nodes, so the board structure is not changed
+def makeevents(model, count, seed):
+    rng = Random(seed)
+    (sw,sh) = dg.SCREENSIZE
+    targets = visiblenodes(model) or [(sw//2, sh//2)]
+    events = []
+    pos = (sw//2, sh//2)
+    while len(events)<count:
+        target = rng.choice(targets)
+        steps = rng.randint(2,6)
+        for step in range(1,steps+1):
+            newpos = (pos[0]+(target[0]-pos[0])*step//steps, pos[1]+(target[1]-pos[1])*step//steps)
+            events.append(pg.event.Event(pg.MOUSEMOTION, pos=newpos, rel=(newpos[0]-pos[0], newpos[1]-pos[1]), buttons=(0,0,0)))
+            pos = newpos
+        if rng.random()<.5:
+           button = rng.choice((1,3))
+           events.append(pg.event.Event(pg.MOUSEBUTTONDOWN, pos=pos, button=button))
+           events.append(pg.event.Event(pg.MOUSEBUTTONUP, pos=pos, button=button))
+    return events[:count]
+
+def percentiles(samples):
+    if not samples:
+       return {}
+    samples = sorted(samples)
+    def percentile(p):
+        return samples[min(len(samples)-1, int(p/100*len(samples)))]
+    return {'count': len(samples),
+            'mean': sum(samples)/len(samples),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': samples[-1]}
+
+# run one scenario: state on a generated board of n nodes or a board file (see dg.loadboard),
+# zoom 'node' (full detail) or 'board' (whole board on screen)
+def scenario(app, state, board, zoom, events, eventsperframe, budget, seed):
+    model = app.model
+    if isinstance(board, str):
+       dg.loadboard(model, board)
+       # the layout of placed nodes would take up the frames, like makeboard's boards they are measured as they are
+       model.layout = None
+       if not model.nodes.amounts.any():
+          # files without dollars get random ones like makeboard's boards, else the game is solved right away
+          model.nodes.amounts[:] = np.random.default_rng(seed).integers(-3, 4, len(model.nodes.amounts))
+    else:
+       makeboard(model, board, seed)
+    model.camera = dg.Camera()
+    if zoom=='board':
+       (ids, xy, amounts) = dg.nodearrays(model)
+       ((left, top), (right, bottom)) = (xy.min(axis=0).tolist(), xy.max(axis=0).tolist())
+       model.camera.zoom = max(dg.MINZOOM, min(1, dg.SCREENSIZE[0]/(right-left+2*dg.CIRCLESIZE), dg.SCREENSIZE[1]/(bottom-top+2*dg.CIRCLESIZE)))
+       model.camera.offset = (left-dg.CIRCLESIZE, top-dg.CIRCLESIZE)
+    else:
+       model.camera.offset = (0,0)
+    app.setup_states({'editor': dg.Editor(), 'game': dg.Game()}, state)
+
+    # the first frame builds caches (spatial index, density image), it's recorded separately
+    model.draw = True
+    start = time.perf_counter()
+    app.update()
+    firstframe = time.perf_counter()-start
+
+    eventtimes = []
+    frametimes = []
+    started = time.perf_counter()
+    for (i, event) in enumerate(makeevents(model, events, seed)):
+        start = time.perf_counter()
+        app.doevent(event)
+        eventtimes.append(time.perf_counter()-start)
+        if (i+1)%eventsperframe==0:
+           # draw every frame, not only when the events changed something, to measure the full redraw
+           model.draw = True
+           start = time.perf_counter()
+           app.update()
+           frametimes.append(time.perf_counter()-start)
+        if time.perf_counter()-started > budget:
+           break
+    result = {'state': state, 'nodes': len(model.nodes), 'edges': len(model.edges), 'zoom': zoom,
+              'firstframe': firstframe,
+              'event': percentiles(eventtimes),
+              'frame': percentiles(frametimes)}
+    if isinstance(board, str):
+       result['board'] = board
+    return result
+
+def key(result):
+    return '%s/%s/%s' % (result['state'], result.get('board', result['nodes']), result['zoom'])
+
+def compare(results, baseline):
+    old = {key(result): result for result in baseline['results']}
+    print()
+    print('%-24s %12s %12s %8s' % ('scenario', 'old p50 ms', 'new p50 ms', 'ratio'))
+    for result in results:
+        if not key(result) in old:
+           continue
+        for kind in ('event', 'frame'):
+            before = old[key(result)][kind].get('p50')
+            after = result[kind].get('p50')
+            if before and after:
+               print('%-24s %12.3f %12.3f %8.2f' % (key(result)+' '+kind, before*1000, after*1000, after/before))
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless Dollar Game benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='board sizes (nodes)')
+    parser.add_argument('--load', nargs='+', default=[], metavar='FILE', help='board files to run the scenarios on as well')
+    parser.add_argument('--states', nargs='+', default=['editor','game'], choices=['editor','game'])
+    parser.add_argument('--zooms', nargs='+', default=['node','board'], choices=['node','board'])
+    parser.add_argument('--events', type=int, default=400, help='synthetic events per scenario')
+    parser.add_argument('--events-per-frame', type=int, default=4)
+    parser.add_argument('--budget', type=float, default=20, help='seconds per scenario, stops feeding events after that')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help='earlier output file to compare with')
+    args = parser.parse_args()
+
+    app = dg.Controller()
+    results = []
+    for board in args.sizes+args.load:
+        for state in args.states:
+            for zoom in args.zooms:
+                result = scenario(app, state, board, zoom, args.events, args.events_per_frame, args.budget, args.seed)
+                results.append(result)
+                print('%-24s first frame %8.1f ms  event p50 %8.3f p99 %8.3f ms  frame p50 %8.3f p99 %8.3f ms'
+                      % (key(result), result['firstframe']*1000,
+                         result['event'].get('p50',0)*1000, result['event'].get('p99',0)*1000,
+                         result['frame'].get('p50',0)*1000, result['frame'].get('p99',0)*1000))
+
+    output = {'python': platform.python_version(),
+              'pygame': pg.version.ver,
+              'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'arguments': vars(args),
+              'results': results}
+    with open(args.output, 'w') as outputfile:
+         json.dump(output, outputfile, indent=1)
+
+    if args.compare:
+       with open(args.compare) as baselinefile:
+            compare(results, json.load(baselinefile))
+    pg.quit()
+
+if __name__ == '__main__':
+    main()
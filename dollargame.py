@@ -5,15 +5,36 @@ put into the public domain by Olaf Doschke (olaf@doschke.name - http://www.dosch
 You need Python 3 and pygame to run this (tested with python 3.6.5 and pygame 1.9.4)
 """
 
-import sys, os, pickle, operator, math
+import sys, os, pickle, operator, math, gzip, time, argparse, json, heapq
+from collections import deque
+from collections.abc import MutableMapping, MutableSet
+import numpy as np
 import pygame as pg
+import boardio, boardhash
 from pygame.locals import *
-from random import random
+from random import Random
+
+# all randomness of the game comes from here, so recordings can be replayed deterministically (see Recorder)
+rng = Random()
 
 #some global constants
 BACKGROUND = "brownpaper.jpg"
 SCREENSIZE = (1200,900)
 CIRCLESIZE = 50
+LAYOUTSTEPS = 3 # force directed layout iterations per frame
+DIRECTREPULSIONNODES = 100 # up to this many nodes the layout computes the repulsion of all node pairs
+MINZOOM = 1/64
+MAXZOOM = 4
+ZOOMSTEP = 1.2 # zoom factor per mouse wheel step
+# level of detail: on screen node radius (pixels) below which labels are left out
+# and below which nodes become points and edges a density image
+LODLABELRADIUS = 12
+LODPOINTRADIUS = 3
+DENSITYSIZE = 1024 # longest side of the edge density image in pixels
+DENSITYSAMPLES = 1<<22 # points sampled along all edges for the density image
+LAYOUTMAXNODES = 20000 # loaded boards with more nodes are not force directed, just placed
+EDGECANDIDATES = 64 # the editor offers new edges between this many nodes nearest to the mouse
+MAXREGENERATE = 20 # random boards isomorphic to an earlier one are generated anew up to this often
 TITLEFONTSIZE = CIRCLESIZE<<1
 
 BLACK = (0,0,0,255)
@@ -23,15 +44,232 @@ GRAPHCOLOR = (16,64,128,255)
 ADDCOLOR = (16,192,128,255)
 REMOVECOLOR = (255,0,0,255)
 HIGHLIGHTCOLOR = (255,255,255,255)
+SELECTCOLOR = (255,160,0,255)
+HINTCOLOR = (255,255,0,255)
 TRANSPARENTCOLOR = (255,255,255,0)
 TITLEFONT = "Arial Black"
 TEXTFONT = "Arial"
 NODEFONT = "Kalam.ttf"
+CACHEDIR = ".dollargamecache" # decoded images and resolved font files are kept here between runs
+
+# Asset manager: images are loaded, converted to the display format and scaled only once,
+# fonts are resolved only when first used and then kept per size.
+# Decoding the background jpg and scanning the system fonts are the slow parts of starting up,
+# so the decoded (and scaled) pixels and the resolved font file names are cached on disk.
+class Assets:
+    def __init__(self, cachedir=CACHEDIR):
+        self.cachedir = cachedir
+        self.images = {}
+        self.fonts = {}
+        self.fontpaths = None
+
+    def cachefile(self, name):
+        return os.path.join(self.cachedir, name)
+
+    def writecache(self, name, *values):
+        try:
+           os.makedirs(self.cachedir, exist_ok=True)
+           with open(self.cachefile(name),'wb') as cache:
+                for value in values:
+                    pickle.dump(value, cache)
+        except OSError:
+           # no cache then, just slower next time
+           pass
+
+    # image file, scaled to cover size (if given) and cropped to it just like a blit at (0,0) would
+    def image(self, name, size=None, alpha=False):
+        key = (name, size, alpha)
+        profiler.hit('image', key in self.images)
+        if not key in self.images:
+           surface = self.loadimage(name, size, alpha)
+           # converting needs a display, without one the image is converted when asked for next time
+           if pg.display.get_surface() is None:
+              return surface
+           self.images[key] = surface.convert_alpha() if alpha else surface.convert()
+        return self.images[key]
+
+    def loadimage(self, name, size, alpha):
+        pixelformat = 'RGBA' if alpha else 'RGB'
+        stat = os.stat(name)
+        cachename = '%s-%d-%d-%s-%s.cache' % (os.path.basename(name), stat.st_mtime_ns, stat.st_size,
+                                             'x'.join(map(str,size)) if size else 'native', pixelformat)
+        try:
+           with open(self.cachefile(cachename),'rb') as cache:
+                cachedsize = pickle.load(cache)
+                pixels = pickle.load(cache)
+           return pg.image.frombuffer(pixels, cachedsize, pixelformat)
+        except Exception:
+           pass
+
+        surface = pg.image.load(name)
+        if size:
+           (iw,ih) = surface.get_size()
+           factor = max(1, size[0]/iw, size[1]/ih)
+           if factor>1:
+              surface = pg.transform.smoothscale(surface, (math.ceil(iw*factor), math.ceil(ih*factor)))
+           surface = surface.subsurface((0,0)+tuple(size)).copy()
+        self.writecache(cachename, surface.get_size(), pg.image.tostring(surface, pixelformat))
+        return surface
+
+    # font files (like NODEFONT) are used directly, system font names are resolved once,
+    # falling back to the bundled NODEFONT if there is no such system font
+    def fontpath(self, name):
+        if os.path.isfile(name):
+           return name
+        if self.fontpaths is None:
+           try:
+              with open(self.cachefile('fonts.cache'),'rb') as cache:
+                   self.fontpaths = pickle.load(cache)
+           except Exception:
+              self.fontpaths = {}
+        path = self.fontpaths.get(name)
+        if path is None or not os.path.isfile(path):
+           path = pg.font.match_font(name) or NODEFONT
+           self.fontpaths[name] = path
+           self.writecache('fonts.cache', self.fontpaths)
+        return path
+
+    def font(self, name, size):
+        key = (name, size)
+        profiler.hit('font', key in self.fonts)
+        if not key in self.fonts:
+           self.fonts[key] = pg.font.Font(self.fontpath(name), size)
+        return self.fonts[key]
+
+assets = Assets()
+
+# Profiler: timing spans, counters and cache hit rates, shown in an overlay (F3) and/or written as
+# Chrome trace (chrome://tracing or https://ui.perfetto.dev) timeline, see --profile.
+# When disabled span() hands out one shared do nothing context manager and the other methods return at once,
+# so the instrumentation left in the code costs next to nothing.
+class NullSpan:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exception):
+        return False
+
+class Span:
+    __slots__ = ['profiler', 'name', 'detail', 'start']
+    def __init__(self, profiler, name, detail):
+        self.profiler = profiler
+        self.name = name
+        self.detail = detail
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exception):
+        self.profiler.record(self.name, self.detail, self.start, time.perf_counter())
+        return False
+
+MAXTRACEEVENTS = 1<<20
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.overlay = False
+        self.trace = None
+        self.nullspan = NullSpan()
+        self.origin = time.perf_counter()
+        self.lastframe = self.origin
+        self.frames = deque(maxlen=60) # (frame time, counters, spans) of the latest frames
+        self.spans = {} # name: [seconds, calls] of the current frame
+        self.counters = {}
+        self.caches = {} # name: [hits, misses]
+        self.started = {} # name: start time of the spans begun (see begin)
+
+    # start recording a Chrome trace, written by dump()
+    def tracing(self):
+        self.enabled = True
+        self.trace = deque(maxlen=MAXTRACEEVENTS)
+
+    def toggleoverlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or not self.trace is None
+        self.reset()
+
+    # forget the statistics so far, the trace is kept
+    def reset(self):
+        self.frames.clear()
+        self.spans = {}
+        self.counters = {}
+        self.caches = {}
+        self.started = {}
+
+    def span(self, name, detail=None):
+        if not self.enabled:
+           return self.nullspan
+        return Span(self, name, detail)
+
+    # a span without a with block, for one step of a longer function: begin(name) ... end(name)
+    def begin(self, name):
+        if self.enabled:
+           self.started[name] = time.perf_counter()
+
+    def end(self, name, detail=None):
+        if self.enabled and name in self.started:
+           self.record(name, detail, self.started.pop(name), time.perf_counter())
+
+    def record(self, name, detail, start, end):
+        spantotal = self.spans.setdefault(name, [0.0, 0])
+        spantotal[0] += end-start
+        spantotal[1] += 1
+        if not self.trace is None:
+           event = {'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                    'ts': (start-self.origin)*1e6, 'dur': (end-start)*1e6}
+           if not detail is None:
+              event['args'] = {'detail': detail}
+           self.trace.append(event)
+
+    def count(self, name, n=1):
+        if self.enabled:
+           self.counters[name] = self.counters.get(name, 0)+n
+
+    def hit(self, cache, hit):
+        if self.enabled:
+           hitsmisses = self.caches.setdefault(cache, [0, 0])
+           hitsmisses[0 if hit else 1] += 1
+
+    # called once per frame by the Controller
+    def frame(self):
+        now = time.perf_counter()
+        if self.enabled:
+           self.frames.append((now-self.lastframe, self.counters, self.spans))
+           self.counters = {}
+           self.spans = {}
+        self.lastframe = now
+
+    # overlay text: frame time, counters and span times averaged over the latest frames and cache hit rates.
+    # Only reads the statistics, calling it again gives the same lines until the next frame
+    def lines(self):
+        frames = max(1, len(self.frames))
+        frametime = sum(frame[0] for frame in self.frames)/frames
+        counters = {}
+        spans = {}
+        for (frametimes, framecounters, framespans) in self.frames:
+            for (name, n) in framecounters.items():
+                counters[name] = counters.get(name, 0)+n
+            for (name, (seconds, calls)) in framespans.items():
+                spantotal = spans.setdefault(name, [0.0, 0])
+                spantotal[0] += seconds
+                spantotal[1] += calls
+        lines = ['frame %.1f ms (%.0f fps)' % (frametime*1000, 1/frametime if frametime else 0)]
+        lines += ['%s per frame %.1f' % (name, n/frames) for (name, n) in sorted(counters.items())]
+        for (name, (seconds, calls)) in sorted(spans.items(), key=lambda span: -span[1][0]):
+            lines.append('%-16s %7.2f ms/frame %6d calls' % (name, seconds*1000/frames, calls))
+        for (name, (hits, misses)) in sorted(self.caches.items()):
+            lines.append('%s cache hits %.1f%%' % (name, 100*hits/max(1, hits+misses)))
+        return lines
+
+    def dump(self, filename):
+        with open(filename, 'w') as tracefile:
+             json.dump({'traceEvents': list(self.trace or ()), 'displayTimeUnit': 'ms'}, tracefile)
+
+profiler = Profiler()
 
 # textgradient draws text in colors with black border
 def textgradient(text, font, size, colors, bordersize):
    # starting simple, just render the text BLACK
-   myfont = pg.font.SysFont(font, size)
+   myfont = assets.font(font, size)
    textsize = myfont.render(text, False, BLACK)
    # but only to determine its size.
    (tw,th) = textsize.get_size()
@@ -104,7 +342,7 @@ class Title(States):
         model.fg.blit(text,((sw-tw)/2,(sh-3*th)/2))
         
         yoffset=(sh-th)/2+10
-        textfont = pg.font.SysFont(TEXTFONT, int(TITLEFONTSIZE/3))
+        textfont = assets.font(TEXTFONT, int(TITLEFONTSIZE/3))
         text = textfont.render('As seen on numberphile', True, BLACK)
         (tw,th) = text.get_size()
         model.fg.blit(text,((sw-tw)/2,yoffset))
@@ -134,8 +372,7 @@ class Title(States):
 
         # keyboard
         if event.type == pg.KEYDOWN:
-           key = pg.key.get_pressed()
-           if key[ord('r')] or key[ord('R')]:
+           if event.key == pg.K_r:
               # R for random game
               model.random = True
            self.done = True
@@ -153,54 +390,111 @@ class Editor(States):
         self.mousemotion = False
     def startup(self, model):
         model.reset()
+        model.selection = None
+        model.band = None
         # trigger a draw as if a mouse move event occurred
         self.mousemotion = True
 
        # no game loaded
         if model.random:
-           if model.random:
-              model.nodes={}
-              model.nodeidcounter=0
-              model.edges=set()
-
-           nodes = int(random()*12)+4
-           (sw,sh) = model.fg.get_size()
-           angle = 0 # arrange nodes in circle starting at angle 0
-           for n in range(nodes):
-               x = int(math.cos(angle)*sw/3+sw/2)
-               y = int(math.sin(angle)*sh/3+sh/2)
-               angle += 2*math.pi/nodes
-               model.nodes[model.nodeidcounter]=[(x,y),0]
-               model.nodeidcounter+=1
-               if n>0:
-                  model.edges.add((n-1,n))
-           for n in range(nodes>>1):
-               n1 = int(random()*nodes)
-               n2 = int(random()*nodes)
-               if n1!=n2:
-                  model.edges.add((n1,n2))
-           genus = len(model.edges)-nodes+1
-           dollars = 0
-           for node in model.nodes.values():
-               amount = int(random()*7)-3
-               node[1] = amount
-               dollars += node[1]
-           model.nodes[0][1] += genus - dollars
+           # regenerate boards isomorphic to one already generated (only a few times, small boards run out).
+           # Equal fingerprints are checked exactly like BoardIndex does, different boards might share one
+           for attempt in range(MAXREGENERATE):
+               self.generate(model)
+               board = boardhash.normalize(model.nodes, model.edges)
+               known = model.generated.setdefault(boardhash.digest(board), [])
+               if not any(boardhash.isomorphic(board, other) for other in known):
+                  known.append(board)
+                  break
+           model.invalidate()
+           # untangle the chords of the circle, a few iterations per frame
+           model.layout = Layout(model)
            
+    def generate(self, model):
+        model.nodes={}
+        model.nodeidcounter=0
+        model.edges=set()
+
+        nodes = int(rng.random()*12)+4
+        (sw,sh) = model.fg.get_size()
+        angle = 0 # arrange nodes in circle starting at angle 0
+        for n in range(nodes):
+            x = int(math.cos(angle)*sw/3+sw/2)
+            y = int(math.sin(angle)*sh/3+sh/2)
+            angle += 2*math.pi/nodes
+            model.nodes[model.nodeidcounter]=[(x,y),0]
+            model.nodeidcounter+=1
+            if n>0:
+               model.edges.add((n-1,n))
+        for n in range(nodes>>1):
+            n1 = int(rng.random()*nodes)
+            n2 = int(rng.random()*nodes)
+            if n1!=n2:
+               model.edges.add((n1,n2))
+        genus = len(model.edges)-nodes+1
+        dollars = 0
+        for node in model.nodes.values():
+            amount = int(rng.random()*7)-3
+            node[1] = amount
+            dollars += node[1]
+        model.nodes[0][1] += genus - dollars
+    # the nearest edge within CIRCLESIZE/2 of pos, existing or potential, and its distance.
+    # An existing edge will be drawn with REMOVECOLOR to signal it is removable with a click.
+    # A non-existing edge will be drawn with ADDECOLOR to signal it as created with a click.
+    # Existing edges come from the spatial index cells around pos, potential ones are all pairs
+    # of the EDGECANDIDATES nodes nearest to pos, so a motion costs the same on any board size
+    def nearestedge(self, model, pos):
+        index = model.spatialindex()
+        (MouseX, MouseY) = pos
+        mindistance = (CIRCLESIZE/2)**2 # compared squared
+        nearestedge = None
+        near = index.edges((MouseX-CIRCLESIZE/2, MouseY-CIRCLESIZE/2, MouseX+CIRCLESIZE/2, MouseY+CIRCLESIZE/2))
+        edges = sorted(near)
+        ends = np.array(edges, dtype=np.int64).reshape(-1,2)
+        (a, b) = (index.positionsof(ends[:,0]).tolist(), index.positionsof(ends[:,1]).tolist())
+        for (edge, (ax,ay), (bx,by)) in zip(edges, a, b):
+            distance = segment_dist_sqrd(MouseX, MouseY, ax, ay, bx, by)
+            if mindistance>distance:
+               (mindistance, nearestedge) = (distance, edge)
+        rows = index.nearby(pos, EDGECANDIDATES)
+        rows = rows[np.argsort(index.ids[rows])]
+        ids = index.ids[rows].tolist()
+        candidates = Vec2dArray.fromarray(index.xy[rows])
+        # pairs of candidates that are edges already, these were looked at above
+        column = {nodeid: i for (i, nodeid) in enumerate(ids)}
+        existing = np.zeros((len(ids), len(ids)), dtype=bool)
+        for (node1, node2) in near:
+            if node1 in column and node2 in column:
+               existing[column[node1], column[node2]] = existing[column[node2], column[node1]] = True
+        # each candidate with all later ones at once, all into the same buffer
+        buffer = np.empty(len(ids))
+        for first in range(len(ids)-1):
+            distances = candidates.segment_dist_sqrd(pos, first, first+1, out=buffer[first+1:])
+            distances[existing[first,first+1:]] = math.inf
+            second = int(distances.argmin())
+            if mindistance>distances[second]:
+               (mindistance, nearestedge) = (float(distances[second]), (ids[first], ids[first+1+second]))
+        return (nearestedge, math.sqrt(mindistance))
+
     def cleanup(self, model):
         model.fg.fill((0,0,0,0))
     def doevent(self, event, model):
 
         # process keyboard events
         if event.type == pg.KEYDOWN:
-           key = pg.key.get_pressed()
-           if key[ord('s')] or key[ord('S')]:
+           if event.key == pg.K_s:
               # S for saving this game
               # simple binary aving of the model.nodes dict and model.edges set plus node counter (next node index)
               with open('dollargame.sav','wb') as savegame:
                    pickle.dump(model.nodes, savegame)
                    pickle.dump(model.edges, savegame)
                    pickle.dump(model.nodeidcounter, savegame)
+           elif event.key == pg.K_l:
+              # L for (re)arranging the nodes with the force directed layout
+              model.layout = Layout(model)
+           elif event.key in SHIFTKEYS+CTRLKEYS:
+              # held for selecting or transforming nodes, see the mouse events
+              pass
            else:
               # Any other key. swtich to game state
               self.done = True
@@ -221,26 +515,30 @@ class Editor(States):
            model.reset() # resets some settings of the model to determine all these things
 
            # Some essential information to know mouse state
-           (MouseX, MouseY) = pg.mouse.get_pos()
-           (leftbutton, middlebutton, rightbutton) = pg.mouse.get_pressed()
+           # the mouse position is transformed to world coordinates, which are used in model.nodes
+           (MouseX, MouseY) = model.camera.toworld(model.mouse.pos)
+           (leftbutton, middlebutton, rightbutton) = model.mouse.pressed
            # Mouse motion can happen while a button is pressed,
            # and it might differ from the last mousebutondown event.
 
+           # 0. Selecting nodes or transforming the selected ones takes the mouse for itself
+           if leftbutton and not model.band is None:
+              if model.band[0]=='rect':
+                 model.band[1][1:] = [(MouseX, MouseY)]
+              else:
+                 model.band[1].append((MouseX, MouseY))
+              return
+           if leftbutton and not model.selection is None and not model.selection.mode is None:
+              # the positions are updated once per frame for the whole group, see Controller.update
+              model.selection.drag((MouseX, MouseY))
+              model.nearestnodeindex = model.dragnodeindex
+              model.addamount = 0
+              return
+
            # 1. Dtermine a nearest node
-           mindistance = CIRCLESIZE**2
-           for i in range(model.nodeidcounter):
-               try:
-                  # not all indexes might have nodes (as editing can also delete nodes)
-                  # therefore just try accessing model.nodes[i]
-                  (node, nodevalue) = model.nodes[i]
-               except:
-                  continue # no node with such an index: continue the loop
-               distance = (MouseX-node[0])**2+(MouseY-node[1])**2 # actually square distance,
-               
-               # but mindistance also is CIRCLESIZE squared (x**2 means pow(x,2) or x^2 in other programming languages).
-               if mindistance>distance:
-                  mindistance=distance
-                  model.nearestnodeindex = i
+           # the spatial index only looks at nodes in the grid cells around the mouse within CIRCLESIZE
+           with profiler.span('nearest node'):
+              model.nearestnodeindex = model.spatialindex().nearest((MouseX, MouseY), CIRCLESIZE)
 
            # 2. With leftbutton pressed, drag and drop of the nearest node:
            if leftbutton:
@@ -250,6 +548,7 @@ class Editor(States):
               if model.dragnodeindex>=0:
                  # drag - let the node position follow the mouse position.
                  model.nodes[model.dragnodeindex][0] = (MouseX, MouseY)
+                 model.invalidate()
                  # fast mouse moves meanwhile might have overridden nearestnodeindex! Therefore:
                  model.nearestnodeindex = model.dragnodeindex
                  # dragging means no change of the node dollar amount value:
@@ -259,48 +558,9 @@ class Editor(States):
            if model.nearestnodeindex<0:
               # if the mousepointer is in a node, that node has the focus.
               # Therefore only determine nearest edge, if no node has focus
-              
-              mindistance = CIRCLESIZE/2
-              model.nearestedgedistance = mindistance
-              # iterate all possible edges between nodes, no matter whether they exist or not.
-              # An existing edge will be drawn with REMOVECOLOR to signal it is removable with a click.
-              # A non-existing edge will be drawn with ADDECOLOR to signal it as created with a click.
-              
-              for node1index in range(model.nodeidcounter):
-                 for node2index in range(node1index+1,model.nodeidcounter):
-                     # compute possible edge line from point EdgeA to point EdgeB
-                     try:
-                        # not all indexes might have nodes (as editing can also delete nodes)
-                        # therefore just try accessing model.nodes[]
-                        node1 = model.nodes[node1index][0]
-                        node2 = model.nodes[node2index][0]
-                        EdgeA, EdgeB = Vec2d(node1), Vec2d(node2)
-                     except:
-                        # one node doesn't exit, so that's not an edge to care about
-                        continue
-
-                     MousePosition = Vec2d(MouseX, MouseY)
-                     # vector along edge from point A pointing to paoint B
-                     EdgeVector = (EdgeB - EdgeA)
-                     # Mousevector realtive to same origin point A
-                     RelativeMousePosition = MousePosition-EdgeA
-                     # dot products gives projected length (famously 0 for perdicular vectors)
-                     EdgePosition = RelativeMousePosition.dot(EdgeVector)/(EdgeVector.get_length()**2)
-                     # that should be between 0 and 1
-                     if EdgePosition>=0 and EdgePosition <=1:
-                        ProjectedEdgePostiion =  EdgeA + EdgePosition * EdgeVector # That's a point on the edge line
-                        distance = (MousePosition - ProjectedEdgePostiion).get_length()
-                     else:
-                        # we need some value to compare mindistance with
-                        #setting distance to mindistance means no change of the nearest edge found
-                        distance = mindistance
-                       
-                     if mindistance>distance:
-                        # new nearest edge found:
-                        mindistance=distance
-                        model.nearestedge = (node1index,node2index)
-                        
-           model.nearestedgedistance = mindistance             
+              with profiler.span('nearest edge'):
+                 (model.nearestedge, model.nearestedgedistance) = self.nearestedge(model, (MouseX, MouseY))
+
            # 4. new node position
            if model.nearestnodeindex<0 and model.nearestedge is None:
               # making this a condition also means nodes cannot overlap
@@ -311,7 +571,25 @@ class Editor(States):
 
            # mouseclick can potentially start a new drag operation
            model.dragnodeindex = -1
-           (leftbutton, middlebutton, rightbutton) = pg.mouse.get_pressed()
+           (leftbutton, middlebutton, rightbutton) = model.mouse.pressed
+
+           if leftbutton and model.nearestnodeindex<0 and (model.mouse.shift or model.mouse.ctrl):
+              # shift drag selects the nodes in a rectangle, ctrl drag the nodes in a lasso
+              start = model.camera.toworld(model.mouse.pos)
+              model.band = ('lasso' if model.mouse.ctrl else 'rect', [start])
+              model.draw = True
+              return
+           if leftbutton and model.nearestnodeindex<0 and model.nearestedge is None and not model.selection is None:
+              # clicking empty space just ends the selection
+              model.selection = None
+              model.draw = True
+              return
+           if leftbutton and not model.selection is None and model.nearestnodeindex in model.selection:
+              # dragging a selected node moves all selected nodes, with shift it scales them, with ctrl it rotates them
+              model.selection.grab(model, 'scale' if model.mouse.shift else 'rotate' if model.mouse.ctrl else 'move',
+                                   model.camera.toworld(model.mouse.pos))
+              model.layout = None
+              model.dragnodeindex = model.nearestnodeindex
 
            # if a nearestnode is known from üprevious mousemotion events
            if  model.nearestnodeindex>=0:
@@ -326,8 +604,9 @@ class Editor(States):
 
            # mouseclick off any near edge or node means adding anew node:
            if model.nearestedge is None and model.nearestnodeindex<0 and leftbutton:
-              (MouseX,MouseY) = pg.mouse.get_pos()
+              (MouseX,MouseY) = model.camera.toworld(model.mouse.pos)
               model.nodes[model.nodeidcounter]=[(MouseX,MouseY),0]
+              model.invalidate()
               model.nearestnodeindex = model.nodeidcounter
               model.nodeidcounter+=1
               model.draw = True # there's something new to draw
@@ -352,20 +631,27 @@ class Editor(States):
            # or adding a non existing edge.
            # One of the actions will be possible:
            if not model.nearestedge is None:
+              # edges per node before the change
+              degree = model.spatialindex().degree
+              removed = model.nearestedge in model.edges
               try:
                  model.edges.remove(model.nearestedge)
               except:
                  # removing failes, so we can add it instead
                  model.edges.add(model.nearestedge)
+              model.invalidate()
 
               # in case this is the last edge for a specific node remove it
               # this isn't throughlychecking all nodes
               # standalone nodes arepossible
-              try:
-                 del model.nodes[model.removenodeindex]
-                 model.removenodeindex = -1
-              except:
-                 pass
+              # removenodeindex was determined when drawing, which might have been before the latest mouse motion,
+              # so make sure it really is a node of this edge without any edges left
+              if model.removenodeindex in model.nearestedge and removed and degree[model.removenodeindex]==1:
+                 try:
+                    del model.nodes[model.removenodeindex]
+                 except:
+                    pass
+              model.removenodeindex = -1
 
               # Something has changes, so draw that...
               model.draw = True
@@ -374,6 +660,21 @@ class Editor(States):
               self.mousemotion = True
 
         elif event.type == pg.MOUSEBUTTONUP:
+           if not model.band is None:
+              (kind, points) = model.band
+              model.band = None
+              if kind=='rect':
+                 (x1,y1) = points[0]
+                 (x2,y2) = points[-1]
+                 selected = list(model.spatialindex().nodes((min(x1,x2), min(y1,y2), max(x1,x2), max(y1,y2))))
+              else:
+                 selected = model.spatialindex().inside(points)
+              model.selection = Selection(selected) if selected else None
+              model.draw = True
+              self.mousemotion = True
+              return
+           if not model.selection is None and not model.selection.mode is None:
+              model.selection.release(model)
            # drag operation ends here:
            model.dragnodeindex = -1
            try:
@@ -394,6 +695,7 @@ class Game(States):
         self.next = 'title'
     def startup(self, model):
         model.reset()
+        model.hints = Hints(model)
 
         # draw the screen...
         model.draw = True
@@ -404,16 +706,22 @@ class Game(States):
         model.fg.fill((0,0,0,0))
         model.solved = False
         model.random = False
+        model.hints = None
         
     def doevent(self, event, model):
         if event.type == pg.KEYDOWN:
-           self.done = True
+           if event.key == pg.K_h:
+              # H shows or hides the hint
+              model.showhints = not model.showhints
+              model.draw = True
+           else:
+              self.done = True
         elif event.type == pg.MOUSEBUTTONDOWN:
            if model.solved:
               self.done = True
               return
           
-           (leftbutton, middlebutton, rightbutton) = pg.mouse.get_pressed()
+           (leftbutton, middlebutton, rightbutton) = model.mouse.pressed
            if  model.nearestnodeindex>=0:
               if leftbutton:
                  model.addamount = -1
@@ -426,43 +734,26 @@ class Game(States):
            # determine nearest node (means hovered node, actually, if the mouse is within the node circle).
            oldnearestnodeindex = model.nearestnodeindex
            model.reset()
-           (MouseX, MouseY) = pg.mouse.get_pos()
-
-           mindistance = CIRCLESIZE**2
-           for i in range(model.nodeidcounter):
-               try:
-                  # not all indexes might have nodes (as editing can also delete nodes)
-                  # therefore just try accessing model.nodes[]
-                  (node, nodevalue) = model.nodes[i]
-               except:
-                  continue
-               distance = (MouseX-node[0])**2+(MouseY-node[1])**2
-               if mindistance>distance:
-                  mindistance=distance
-                  model.nearestnodeindex = i
-                  if model.nearestnodeindex != oldnearestnodeindex:
-                     model.addamount = 0
-                  model.draw = True
+           (MouseX, MouseY) = model.camera.toworld(model.mouse.pos)
 
-        elif event.type == pg.MOUSEBUTTONUP:
+           with profiler.span('nearest node'):
+              model.nearestnodeindex = model.spatialindex().nearest((MouseX, MouseY), CIRCLESIZE)
            if model.nearestnodeindex>=0:
-              # along each node give or take model.addamount
-              for edge in model.edges:
-                  othernodeindex = -1
-                  if edge[0] == model.nearestnodeindex:
-                     othernodeindex = edge[1]
-                  if edge[1] == model.nearestnodeindex:
-                     othernodeindex = edge[0]
-                  if othernodeindex>=0:  
-                     model.nodes[model.nearestnodeindex][1] += model.addamount
-                     model.nodes[othernodeindex][1] -= model.addamount
-                     model.draw = True
+              if model.nearestnodeindex != oldnearestnodeindex:
+                 model.addamount = 0
+              model.draw = True
+
+        elif event.type == pg.MOUSEBUTTONUP:
+           if model.nearestnodeindex>=0 and model.addamount!=0:
+              # along each edge of the node give or take model.addamount, the hints keep track
+              model.hints.fire(model, model.nearestnodeindex, -model.addamount)
+              model.draw = True
            model.addamount = 0
             
 class Model:
-    def __init__(self):
-        self.bg = pg.image.load(BACKGROUND)        
-        self.fg = pg.Surface(SCREENSIZE, pg.SRCALPHA)
+    def __init__(self, size=SCREENSIZE):
+        self.bg = assets.image(BACKGROUND, size)
+        self.fg = pg.Surface(size, pg.SRCALPHA)
         self.draw = False
         self.nodes = {}
         self.nodeidcounter=0
@@ -473,7 +764,29 @@ class Model:
         self.addamount = 0
         self.solved = False
         self.random = False
+        self.generated = {} # random boards generated so far by fingerprint (see boardhash.py)
+        self.layout = None
+        self.selection = None # Selection of the editor
+        self.hints = None # Hints of the game
+        self.showhints = False
+        self.band = None # rubber band or lasso being drawn: ('rect' or 'lasso', world points)
+        self.camera = Camera(size)
+        self.mouse = Mouse()
+        self.index = None
+        self.changes = 0 # invalidate() calls so far, others (like Layout) notice any change of the graph by it
         self.reset()
+
+    # spatial index of node positions and edges, rebuilt lazily after the graph changed
+    def spatialindex(self):
+        profiler.hit('spatial index', not self.index is None)
+        if self.index is None:
+           self.index = SpatialIndex(self)
+        return self.index
+
+    # call this whenever nodes are moved, added or removed or edges change
+    def invalidate(self):
+        self.index = None
+        self.changes += 1
         
     def reset(self):
         self.nearestnodeindex = -1
@@ -481,146 +794,1336 @@ class Model:
         self.nearestedgedistance = -1
         self.newnode = None
 
-class View:
+# Compact boards: for large (loaded) boards the nodes and edges are kept in arrays instead of a dict of lists and a set of tuples,
+# which take over 200 bytes per node or edge. Positions are float32 and amounts int64 arrays indexed by node id,
+# edges int32 arrays in CSR form (for each node the sorted ids of its higher numbered neighbours).
+# CompactNodes and CompactEdges behave like the dict and the set of a Model, so Editor, Game and View work with either,
+# while the spatial index, the hints, firing and the layout take the arrays directly (see nodearrays and edgearrays).
+# Pickled (recordings, dollargame.sav) they turn back into a plain dict and set.
+
+# model.nodes[nodeid] of a compact board: reads and writes go to the arrays
+class NodeRecord:
+    __slots__ = ['nodes', 'nodeid']
+
+    def __init__(self, nodes, nodeid):
+        self.nodes = nodes
+        self.nodeid = nodeid
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, key):
+        if key==0:
+           (x, y) = self.nodes.positions[self.nodeid].tolist()
+           return (x, y)
+        elif key==1:
+           return int(self.nodes.amounts[self.nodeid])
+        raise IndexError(key)
+
+    def __setitem__(self, key, value):
+        if key==0:
+           self.nodes.positions[self.nodeid] = value
+        elif key==1:
+           self.nodes.amounts[self.nodeid] = value
+        else:
+           raise IndexError(key)
+
+    def __iter__(self):
+        yield self[0]
+        yield self[1]
+
+    def __repr__(self):
+        return repr([self[0], self[1]])
+
+class CompactNodes(MutableMapping):
+    def __init__(self, positions, amounts):
+        self.amounts = np.array(amounts, dtype=np.int64)
+        self.positions = np.array(positions, dtype=np.float32).reshape(-1,2)
+        self.alive = np.ones(len(self.amounts), dtype=bool)
+        self.count = len(self.amounts)
+
+    @property
+    def nbytes(self):
+        return self.amounts.nbytes+self.positions.nbytes+self.alive.nbytes
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, nodeid):
+        return isinstance(nodeid, (int, np.integer)) and 0<=nodeid<len(self.alive) and bool(self.alive[nodeid])
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self.alive).tolist())
+
+    def __getitem__(self, nodeid):
+        if not nodeid in self:
+           raise KeyError(nodeid)
+        return NodeRecord(self, nodeid)
+
+    # new nodes (like the editor adds them) grow the arrays by half at least
+    def __setitem__(self, nodeid, node):
+        if nodeid>=len(self.alive):
+           size = max(nodeid+1, len(self.alive)*3//2)
+           self.amounts = np.concatenate((self.amounts, np.zeros(size-len(self.amounts), dtype=np.int64)))
+           self.positions = np.concatenate((self.positions, np.zeros((size-len(self.positions), 2), dtype=np.float32)))
+           self.alive = np.concatenate((self.alive, np.zeros(size-len(self.alive), dtype=bool)))
+        (self.positions[nodeid], self.amounts[nodeid]) = node
+        if not self.alive[nodeid]:
+           self.alive[nodeid] = True
+           self.count += 1
+
+    def __delitem__(self, nodeid):
+        if not nodeid in self:
+           raise KeyError(nodeid)
+        self.alive[nodeid] = False
+        self.count -= 1
+
+    # positions of many nodes at once, ids and positions as arrays
+    def setpositions(self, ids, positions):
+        self.positions[ids] = positions
+
+    def __reduce__(self):
+        return (dict, ({nodeid: [node[0], node[1]] for (nodeid, node) in self.items()},))
+
+# Edges as (lower node id, higher node id). Edges added or removed later (by the editor) are kept in two small sets
+# on top of the CSR arrays, which stay as loaded.
+class CompactEdges(MutableSet):
+    def __init__(self, size, u, v):
+        (u, v) = (np.minimum(u, v), np.maximum(u, v))
+        keys = np.unique(u.astype(np.int64)*size+v)
+        self.indptr = np.searchsorted(keys//size, np.arange(size+1)).astype(np.int64)
+        self.indices = (keys%size).astype(np.int32)
+        self.added = set()
+        self.removed = set()
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes+self.indices.nbytes
+
+    def loaded(self, edge):
+        (node1, node2) = edge
+        if not 0<=node1<len(self.indptr)-1:
+           return False
+        row = self.indices[self.indptr[node1]:self.indptr[node1+1]]
+        i = int(np.searchsorted(row, node2))
+        return i<len(row) and row[i]==node2
+
+    def __len__(self):
+        return len(self.indices)-len(self.removed)+len(self.added)
+
+    def __contains__(self, edge):
+        edge = (min(edge), max(edge))
+        return edge in self.added or (not edge in self.removed and self.loaded(edge))
+
+    def __iter__(self):
+        (u, v) = self.arrays()
+        return zip(u.tolist(), v.tolist())
+
+    def add(self, edge):
+        edge = (min(edge), max(edge))
+        if self.loaded(edge):
+           self.removed.discard(edge)
+        else:
+           self.added.add(edge)
+
+    def discard(self, edge):
+        edge = (min(edge), max(edge))
+        if edge in self.added:
+           self.added.discard(edge)
+        elif self.loaded(edge):
+           self.removed.add(edge)
+
+    # the edge ends as two arrays
+    def arrays(self):
+        u = np.repeat(np.arange(len(self.indptr)-1, dtype=np.int32), np.diff(self.indptr))
+        v = self.indices
+        if self.removed:
+           keep = np.ones(len(u), dtype=bool)
+           for (node1, node2) in self.removed:
+               keep[self.indptr[node1]+np.searchsorted(self.indices[self.indptr[node1]:self.indptr[node1+1]], node2)] = False
+           (u, v) = (u[keep], v[keep])
+        if self.added:
+           added = np.array(sorted(self.added), dtype=np.int32).reshape(-1,2)
+           (u, v) = (np.concatenate((u, added[:,0])), np.concatenate((v, added[:,1])))
+        return (u, v)
+
+    def __reduce__(self):
+        return (set, (set(self),))
+
+# node ids, positions and amounts of a model as arrays
+def nodearrays(model):
+    nodes = model.nodes
+    if isinstance(nodes, CompactNodes):
+       ids = np.flatnonzero(nodes.alive)
+       return (ids, nodes.positions[ids].astype(np.float64), nodes.amounts[ids])
+    ids = np.fromiter(nodes.keys(), dtype=np.int64, count=len(nodes))
+    xy = np.array([node[0] for node in nodes.values()], dtype=np.float64).reshape(-1,2)
+    amounts = np.fromiter((node[1] for node in nodes.values()), dtype=np.int64, count=len(nodes))
+    return (ids, xy, amounts)
+
+def amountsof(model, ids):
+    if isinstance(model.nodes, CompactNodes):
+       return model.nodes.amounts[ids]
+    return np.fromiter((model.nodes[nodeid][1] for nodeid in ids.tolist()), dtype=np.int64, count=len(ids))
+
+# both ends of all edges as arrays
+def edgearrays(model):
+    if isinstance(model.edges, CompactEdges):
+       return model.edges.arrays()
+    edges = np.array(list(model.edges), dtype=np.int64).reshape(-1,2)
+    return (edges[:,0], edges[:,1])
+
+# neighbours of each node id (both directions, an edge given twice counts twice) as CSR arrays
+def adjacency(model):
+    (u, v) = edgearrays(model)
+    ends = np.concatenate((u, v))
+    neighbours = np.concatenate((v, u))
+    order = np.argsort(ends, kind='stable')
+    indptr = np.searchsorted(ends[order], np.arange(model.nodeidcounter+1))
+    return (indptr, neighbours[order])
+
+# peak memory of loading a board and building what the game needs for it (spatial index, hints, density image),
+# measured with tracemalloc on boards of 200k to 500k nodes and 800k edges: about 200 bytes per node and
+# 160 per edge while reading, the spatial index adds more for long edges crossing many cells
+BYTESPERNODE = 400
+BYTESPEREDGE = 300
+MAXBOARDBYTES = 2<<30 # larger boards are refused when loading
+
+def boardbytes(nodes, edges):
+    return nodes*BYTESPERNODE + edges*BYTESPEREDGE
+
+# Firing scripts
+# A firing script tells for every node id how often that node lends (positive count)
+# or borrows (negative count), just like left and right clicks in the Game state.
+# Instead of applying this click by click, the whole script is applied at once:
+# amounts -= L @ x, where L is the graph laplacian (degree matrix minus adjacency matrix).
+# L is kept sparse as two arrays of edge endpoints, so L @ x costs O(nodes+edges).
+class Laplacian:
+    def __init__(self, model):
+        self.size = model.nodeidcounter
+        (self.u, self.v) = edgearrays(model)
+        self.degree = np.bincount(self.u, minlength=self.size) + np.bincount(self.v, minlength=self.size)
+
+    def dot(self, x):
+        x = np.asarray(x, dtype=np.int64)
+        # adjacency product: every edge passes the value of one end to the other end,
+        # added up as int64 (np.bincount would add float64, which is exact only up to 2^53)
+        ax = np.zeros(self.size, dtype=np.int64)
+        np.add.at(ax, self.u, x[self.v])
+        np.add.at(ax, self.v, x[self.u])
+        return self.degree*x - ax
+
+    __matmul__ = dot
+
+# turn a firing script given as dict {nodeid: count} or as sequence indexed by node id
+# into a vector with one entry per node id
+def firingvector(model, firing):
+    x = np.zeros(model.nodeidcounter, dtype=np.int64)
+    if hasattr(firing, 'items'):
+       for nodeid in firing:
+           if not nodeid in model.nodes:
+              raise ValueError('firing script references unknown node '+str(nodeid))
+       x[list(firing.keys())] = wholecounts(list(firing.values()))
+    else:
+       firing = np.asarray(firing)
+       if firing.ndim!=1 or len(firing)!=model.nodeidcounter:
+          raise ValueError('firing script needs one count per node id ('+str(model.nodeidcounter)+')')
+       x[:] = wholecounts(firing)
+       for nodeid in np.flatnonzero(x):
+           if not int(nodeid) in model.nodes:
+              raise ValueError('firing script references deleted node '+str(nodeid))
+    return x
+
+# the counts of a firing script as int64 array, floats only if they are whole numbers
+def wholecounts(counts):
+    counts = np.asarray(counts)
+    if counts.dtype.kind=='b':
+       return counts.astype(np.int64)
+    # anything else, like strings or numbers too large for int64 (object arrays), is refused
+    if counts.dtype.kind in 'iuf' and np.all(counts==np.rint(counts)) and np.all(np.abs(counts)<2**63):
+       return counts.astype(np.int64)
+    raise ValueError('firing script counts must be whole numbers (of at most 63 bits)')
+
+# the node amounts as vector indexed by node id (deleted ids stay 0)
+def amountvector(model):
+    amounts = np.zeros(model.nodeidcounter, dtype=np.int64)
+    (ids, xy, nodeamounts) = nodearrays(model)
+    amounts[ids] = nodeamounts
+    return amounts
+
+# positions of the nodes with the given ids (array) as array of x,y rows
+def positionsof(model, ids):
+    if isinstance(model.nodes, CompactNodes):
+       return model.nodes.positions[ids].astype(np.float64)
+    return np.array([model.nodes[nodeid][0] for nodeid in ids.tolist()], dtype=np.float64).reshape(-1,2)
+
+# move the nodes with the given ids to positions, the other way round
+def setpositions(model, ids, positions):
+    if isinstance(model.nodes, CompactNodes):
+       model.nodes.setpositions(ids, positions)
+    else:
+       for (nodeid, (x,y)) in zip(ids.tolist(), positions.tolist()):
+           model.nodes[nodeid][0] = (x,y)
+
+# the dollars of all nodes together
+def dollarsum(model):
+    if isinstance(model.nodes, CompactNodes):
+       return int(model.nodes.amounts[model.nodes.alive].sum())
+    return sum(node[1] for node in model.nodes.values())
+
+def setamounts(model, amounts):
+    if isinstance(model.nodes, CompactNodes):
+       ids = np.flatnonzero(model.nodes.alive)
+       model.nodes.amounts[ids] = amounts[ids]
+    else:
+       for (nodeid, node) in model.nodes.items():
+           node[1] = int(amounts[nodeid])
+    model.draw = True
+
+# apply a whole firing script to the model in one go, returns whether the board is solved.
+# Given a view the intermediate states are animated: each frame every node still having firings left
+# lends or borrows once more, which is the same as the single clicks of the Game state.
+def fire(model, firing, view=None, state='game', delay=50):
+    x = firingvector(model, firing)
+    laplacian = Laplacian(model)
+    amounts = amountvector(model)
+    # a node gets or gives at most its degree times the largest count on each side,
+    # all dollars (in between as well) have to stay within int64
+    largest = 2*int(laplacian.degree.max(initial=0))*int(np.abs(x).max(initial=0)) + int(np.abs(amounts).max(initial=0))
+    if largest >= 1<<63:
+       raise ValueError('firing script too large, the dollars would not fit into 64 bits')
+
+    if view is None:
+       amounts -= laplacian @ x
+    else:
+       remaining = x.copy()
+       while remaining.any():
+          step = np.sign(remaining)
+          amounts -= laplacian @ step
+          remaining -= step
+          setamounts(model, amounts)
+          view.update(model, state)
+          pg.time.delay(delay)
+
+    setamounts(model, amounts)
+    if not model.hints is None:
+       # the amounts changed behind the back of the hints
+       model.hints = Hints(model)
+    return not (amounts < 0).any()
+
+# Hints for the Game state: which node to fire next.
+# Borrowing at a node in debt is always a sensible move, repeating that (the greedy algorithm) solves every solvable board.
+# Once every node of a connected part of the graph borrowed while in debt (and nothing else was played meanwhile),
+# that part and so the board can't be solved, no matter what is played after.
+# (Firing never changes the dollar sum of a part, so a part with a negative sum is unsolvable right away.)
+# Before that, lending at a node having a dollar for each of its edges next to a node in debt is suggested,
+# it pays off debt without causing any.
+# The state is built once per game, each firing updates it for just the fired node, its neighbours and theirs.
+class Hints:
+    def __init__(self, model):
+        # everything as arrays indexed by node id, neighbours in CSR form
+        (self.indptr, self.neighbours) = adjacency(model)
+        self.degree = np.diff(self.indptr)
+        self.amounts = amountvector(model)
+        size = len(self.amounts)
+
+        # connected parts of the graph: every node points to the lowest node id of its part,
+        # found by repeatedly hooking the parts of both ends of each edge together and shortcutting the pointers
+        (u, v) = (np.repeat(np.arange(size), self.degree), self.neighbours)
+        part = np.arange(size)
+        while True:
+            (pu, pv) = (part[u], part[v])
+            if (pu==pv).all():
+               break
+            low = np.minimum(pu, pv)
+            np.minimum.at(part, pu, low)
+            np.minimum.at(part, pv, low)
+            while True:
+                shortcut = part[part]
+                if (shortcut==part).all():
+                   break
+                part = shortcut
+        self.component = part
+        self.componentsize = np.bincount(part, minlength=size)
+        self.borrowed = {} # nodes that borrowed while in debt, per part
+        self.unsolvable = bool((np.bincount(part, weights=self.amounts, minlength=size)<0).any())
+
+        indebt = self.amounts<0
+        self.debts = set(np.flatnonzero(indebt).tolist())
+        self.debtneighbours = np.bincount(u, weights=indebt[v], minlength=size).astype(np.int64)
+        self.lenders = set(np.flatnonzero((self.debtneighbours>0) & (self.amounts>=self.degree)).tolist())
+        # nodes in debt, most in debt first. Entries get outdated when amounts change, they are skipped then
+        self.heap = [(amount, nodeid) for (nodeid, amount) in zip(np.flatnonzero(indebt).tolist(), self.amounts[indebt].tolist())]
+        heapq.heapify(self.heap)
+        self.touched = set()
+
+    def neighboursof(self, nodeid):
+        return self.neighbours[self.indptr[nodeid]:self.indptr[nodeid+1]].tolist()
+
+    def canlend(self, nodeid):
+        return self.debtneighbours[nodeid]>0 and self.amounts[nodeid]>=self.degree[nodeid]
+
+    def change(self, model, nodeid, amount):
+        before = int(self.amounts[nodeid])
+        after = before+amount
+        self.amounts[nodeid] = after
+        model.nodes[nodeid][1] = after
+        self.touched.add(nodeid)
+        if after<0:
+           heapq.heappush(self.heap, (after, nodeid))
+        if (before<0) != (after<0):
+           if after<0:
+              self.debts.add(nodeid)
+           else:
+              self.debts.discard(nodeid)
+           for neighbour in self.neighboursof(nodeid):
+               self.debtneighbours[neighbour] += 1 if after<0 else -1
+               self.touched.add(neighbour)
+
+    # the node lends times dollars along each of its edges (negative times borrows), just like clicks in the Game state
+    def fire(self, model, nodeid, times):
+        borrowedindebt = times<0 and nodeid in self.debts
+        neighbours = self.neighboursof(nodeid)
+        self.change(model, nodeid, -times*len(neighbours))
+        for neighbour in neighbours:
+            self.change(model, neighbour, times)
+
+        part = int(self.component[nodeid])
+        if borrowedindebt:
+           borrowed = self.borrowed.setdefault(part, set())
+           borrowed.add(nodeid)
+           if len(borrowed)==self.componentsize[part]:
+              self.unsolvable = True
+        else:
+           self.borrowed.pop(part, None)
+
+        for node in self.touched:
+            if self.canlend(node):
+               self.lenders.add(node)
+            else:
+               self.lenders.discard(node)
+        self.touched.clear()
+
+    # (node id, times) to play next, 1 lends, -1 borrows, or None if solved or unsolvable
+    def hint(self):
+        if self.unsolvable or not self.debts:
+           return None
+        for nodeid in self.lenders:
+            return (nodeid, 1)
+        while self.heap[0][1] not in self.debts or self.amounts[self.heap[0][1]]!=self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return (self.heap[0][1], -1)
+
+# Force directed layout (Fruchterman-Reingold) with Barnes-Hut approximation of the node repulsion.
+# All nodes repel each other, edges pull their nodes together. Computing all node pairs costs O(n^2),
+# so nodes are grouped into a quadtree and a whole far away cell acts as a single node at its center of mass,
+# bringing one iteration down to O(n log n). The quadtree is built level by level with np.bincount and
+# walked for all nodes at once, one level per loop pass.
+# The layout is run incrementally, a few iterations per frame (see Controller.update), and cools down
+# until done. Positions are read from and written back to model.nodes, so dragging a node still works.
+class Layout:
+    def __init__(self, model, bounds=None, theta=.8, iterations=300):
+        if bounds is None:
+           (sw,sh) = model.fg.get_size()
+           bounds = (CIRCLESIZE, CIRCLESIZE, sw-CIRCLESIZE, sh-CIRCLESIZE)
+        self.bounds = bounds
+        self.theta = theta
+        self.temperature = (bounds[2]-bounds[0])/10
+        # cool down to half a pixel within the given number of iterations
+        self.cooling = (.5/self.temperature)**(1/iterations)
+        self.index(model)
+
+    @property
+    def done(self):
+        return self.temperature < .5
+
+    # what it takes to go on with the layout later, e.g. in a replay (see Recorder)
+    def state(self):
+        return (self.bounds, self.theta, self.temperature, self.cooling)
+
+    @classmethod
+    def restore(cls, model, state):
+        (bounds, theta, temperature, cooling) = state
+        layout = cls(model, bounds, theta)
+        (layout.temperature, layout.cooling) = (temperature, cooling)
+        return layout
+
+    def index(self, model):
+        # map node ids to dense array indexes
+        self.ids = np.array(sorted(model.nodes), dtype=np.int64)
+        lookup = np.full(model.nodeidcounter+1, -1, dtype=np.int64)
+        lookup[self.ids] = np.arange(len(self.ids))
+        (u, v) = edgearrays(model)
+        self.u = lookup[u]
+        self.v = lookup[v]
+        self.nodecount = len(model.nodes)
+        self.changes = model.changes
+        # optimal distance between nodes
+        area = (self.bounds[2]-self.bounds[0])*(self.bounds[3]-self.bounds[1])
+        self.k = math.sqrt(area/max(1,self.nodecount))
+
+    def repulsion(self, pos):
+        n = len(pos)
+        if n<=DIRECTREPULSIONNODES:
+           # few nodes: all pairs at once is faster than walking the tree
+           d = pos[:,None,:]-pos[None,:,:]
+           d2 = np.maximum((d*d).sum(axis=2), 1e-2)
+           np.fill_diagonal(d2, np.inf)
+           return ((self.k**2/d2)[:,:,None]*d).sum(axis=1)
+        force = np.zeros_like(pos)
+        depth = int(min(10, max(1, math.ceil(math.log(max(n,2),4))+1)))
+        lo = pos.min(axis=0)
+        size = max(float((pos.max(axis=0)-lo).max()), 1.0)*(1+1e-9)
+        q = (pos-lo)/size
+
+        # quadtree levels: per cell the mass (node count) and the center of mass, cell id is x*cells+y
+        mass, comx, comy, nodecell = [], [], [], []
+        for level in range(depth+1):
+            cells = 1<<level
+            c = (q*cells).astype(np.int64)
+            cid = c[:,0]*cells+c[:,1]
+            m = np.bincount(cid, minlength=cells*cells)
+            with np.errstate(invalid='ignore', divide='ignore'):
+               comx.append(np.bincount(cid, weights=pos[:,0], minlength=cells*cells)/m)
+               comy.append(np.bincount(cid, weights=pos[:,1], minlength=cells*cells)/m)
+            mass.append(m)
+            nodecell.append(cid)
+
+        # walk the tree for all nodes at once, p and c are pairs of node index and cell id
+        p = np.arange(n)
+        c = np.zeros(n, dtype=np.int64)
+        k2 = self.k**2
+        for level in range(depth+1):
+            m = mass[level][c].astype(np.float64)
+            cx = comx[level][c]
+            cy = comy[level][c]
+            own = nodecell[level][p]==c
+            if level==depth:
+               # leaf cells: take out the node itself
+               m = m-own
+               keep = m>0
+               with np.errstate(invalid='ignore', divide='ignore'):
+                  cx = np.where(own, (cx*(m+1)-pos[p,0])/m, cx)
+                  cy = np.where(own, (cy*(m+1)-pos[p,1])/m, cy)
+               accept = keep
+            else:
+               dist = np.hypot(pos[p,0]-cx, pos[p,1]-cy)
+               accept = ~own & (size/(1<<level) < self.theta*dist)
+            dx = pos[p[accept],0]-cx[accept]
+            dy = pos[p[accept],1]-cy[accept]
+            d2 = np.maximum(dx*dx+dy*dy, 1e-2)
+            # repulsion k^2/d in direction of d
+            f = k2*m[accept]/d2
+            force[:,0] += np.bincount(p[accept], weights=f*dx, minlength=n)
+            force[:,1] += np.bincount(p[accept], weights=f*dy, minlength=n)
+            if level==depth:
+               break
+
+            # open the remaining cells: continue with their non empty child cells
+            p = p[~accept]
+            c = c[~accept]
+            cells = 1<<level
+            x = (c//cells)<<1
+            y = (c%cells)<<1
+            p = np.repeat(p,4)
+            c = (np.repeat(x,4)+np.tile([0,0,1,1],len(x)))*(cells<<1) + np.repeat(y,4)+np.tile([0,1,0,1],len(y))
+            nonempty = mass[level+1][c]>0
+            p = p[nonempty]
+            c = c[nonempty]
+        return force
+
+    def attraction(self, pos):
+        n = len(pos)
+        force = np.zeros_like(pos)
+        d = pos[self.u]-pos[self.v]
+        dist = np.maximum(np.hypot(d[:,0], d[:,1]), 1e-2)
+        # attraction d^2/k in direction of d
+        f = (dist/self.k)[:,None]*d
+        for axis in range(2):
+            force[:,axis] -= np.bincount(self.u, weights=f[:,axis], minlength=n)
+            force[:,axis] += np.bincount(self.v, weights=f[:,axis], minlength=n)
+        return force
+
+    def step(self, model, iterations=1):
+        # the graph changed (or just some nodes moved) since the latest step, the node ids might be others now
+        if model.changes!=self.changes:
+           self.index(model)
+        if self.nodecount<2:
+           self.temperature = 0
+           return
+
+        pos = positionsof(model, self.ids)
+        # a dragged node stays where the mouse put it
+        pinned = np.flatnonzero(self.ids==model.dragnodeindex)
+        fixed = pos[pinned].copy()
+        for iteration in range(iterations):
+            force = self.repulsion(pos)+self.attraction(pos)
+            length = np.maximum(np.hypot(force[:,0], force[:,1]), 1e-9)
+            pos += force*(np.minimum(length, self.temperature)/length)[:,None]
+            pos[:,0] = np.clip(pos[:,0], self.bounds[0], self.bounds[2])
+            pos[:,1] = np.clip(pos[:,1], self.bounds[1], self.bounds[3])
+            pos[pinned] = fixed
+            self.temperature *= self.cooling
+
+        setpositions(model, self.ids, pos.astype(np.int64))
+        model.invalidate()
+        self.changes = model.changes
+        model.draw = True
+
+# Selected group of nodes in the editor, moved, scaled or rotated as a whole.
+# Mouse motions only note the latest mouse position, Controller.update applies the transform
+# to all positions at once as arrays and writes them back once per frame (see setpositions), like Layout.
+class Selection:
+    def __init__(self, nodeindexes):
+        self.members = set(nodeindexes)
+        self.mode = None # 'move', 'scale' or 'rotate' while grabbed
+        self.target = None # latest mouse position not applied yet
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, nodeindex):
+        return nodeindex in self.members
+
+    # start a transform at world position start
+    def grab(self, model, mode, start):
+        self.members &= model.nodes.keys() # nodes might have been deleted meanwhile
+        self.ids = np.array(sorted(self.members), dtype=np.int64)
+        self.positions = positionsof(model, self.ids)
+        self.center = self.positions.mean(axis=0) if len(self.ids) else np.zeros(2)
+        self.start = np.array(start, dtype=np.float64)
+        self.mode = mode
+        self.target = None
+
+    def drag(self, pos):
+        self.target = pos
+
+    def step(self, model):
+        if self.target is None:
+           return
+        target = np.array(self.target, dtype=np.float64)
+        self.target = None
+        relative = self.positions-self.center
+        if self.mode=='move':
+           positions = self.positions+(target-self.start)
+        else:
+           # scale and rotate around the center, by how the mouse moved relative to it
+           (sx,sy) = self.start-self.center
+           (tx,ty) = target-self.center
+           if self.mode=='scale':
+              factor = math.hypot(tx,ty)/max(1, math.hypot(sx,sy))
+              positions = self.center+relative*factor
+           else:
+              # the rotation of Vec2d.rotated for all nodes at once
+              angle = math.atan2(ty,tx)-math.atan2(sy,sx)
+              (cos, sin) = (math.cos(angle), math.sin(angle))
+              positions = self.center+relative@np.array([[cos, sin], [-sin, cos]])
+        setpositions(model, self.ids, positions)
+        model.invalidate()
+        model.draw = True
+
+    def release(self, model):
+        self.step(model)
+        self.mode = None
+
+# Camera mapping world coordinates (as stored in model.nodes) to screen coordinates.
+# offset is the world position shown in the top left screen corner, zoom the screen pixels per world unit.
+class Camera:
+    def __init__(self, size=SCREENSIZE):
+        self.size = size
+        self.offset = (0.0, 0.0)
+        self.zoom = 1.0
+
+    def toscreen(self, pos):
+        return (int((pos[0]-self.offset[0])*self.zoom), int((pos[1]-self.offset[1])*self.zoom))
+
+    def toworld(self, pos):
+        return (int(pos[0]/self.zoom+self.offset[0]), int(pos[1]/self.zoom+self.offset[1]))
+
+    # world rectangle (left, top, right, bottom) visible on screen, optionally widened by a world margin
+    def viewport(self, margin=0):
+        (sw,sh) = self.size
+        return (self.offset[0]-margin, self.offset[1]-margin,
+                self.offset[0]+sw/self.zoom+margin, self.offset[1]+sh/self.zoom+margin)
+
+    # show the world rectangle (left, top, right, bottom) as large as possible, centered
+    def fit(self, rect):
+        (sw,sh) = self.size
+        width = max(1, rect[2]-rect[0])
+        height = max(1, rect[3]-rect[1])
+        self.zoom = min(MAXZOOM, max(MINZOOM, min(sw/width, sh/height)))
+        self.offset = ((rect[0]+rect[2])/2-sw/self.zoom/2, (rect[1]+rect[3])/2-sh/self.zoom/2)
+
+    # move by a screen distance, e.g. the rel of a mouse motion
+    def pan(self, rel):
+        self.offset = (self.offset[0]-rel[0]/self.zoom, self.offset[1]-rel[1]/self.zoom)
+
+    # zoom by factor, keeping the world position under the given screen position in place
+    def zoomat(self, pos, factor):
+        worldx = pos[0]/self.zoom+self.offset[0]
+        worldy = pos[1]/self.zoom+self.offset[1]
+        self.zoom = min(MAXZOOM, max(MINZOOM, self.zoom*factor))
+        self.offset = (worldx-pos[0]/self.zoom, worldy-pos[1]/self.zoom)
+
+# Mouse state as seen by the events processed so far (see Controller.doevent).
+# The states use this instead of asking pg.mouse, so synthetic or recorded events work just like real ones.
+# That includes the shift and ctrl keys held while clicking or dragging.
+SHIFTKEYS = (pg.K_LSHIFT, pg.K_RSHIFT)
+CTRLKEYS = (pg.K_LCTRL, pg.K_RCTRL)
+class Mouse:
     def __init__(self):
-        self.screen = pg.display.set_mode(SCREENSIZE)
+        self.pos = (0,0)
+        self.pressed = (False, False, False)
+        self.shift = False
+        self.ctrl = False
+
+    def update(self, event):
+        if event.type == pg.MOUSEMOTION:
+           self.pos = event.pos
+           self.pressed = tuple(bool(button) for button in event.buttons[:3])
+        elif event.type in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP):
+           self.pos = event.pos
+           if 1<=event.button<=3:
+              pressed = list(self.pressed)
+              pressed[event.button-1] = event.type == pg.MOUSEBUTTONDOWN
+              self.pressed = tuple(pressed)
+        elif event.type in (pg.KEYDOWN, pg.KEYUP):
+           if event.key in SHIFTKEYS:
+              self.shift = event.type == pg.KEYDOWN
+           elif event.key in CTRLKEYS:
+              self.ctrl = event.type == pg.KEYDOWN
+
+# Spatial index: a uniform grid of cells with cellsize world units.
+# Nodes are put into the cell of their position, edges into all cells of their bounding box.
+# Edges with a bounding box spanning more than MAXEDGECELLS cells are kept in a separate list and tested all at once.
+# The cells are numbered column by column and the entries kept as arrays sorted by cell number,
+# so each column of a queried rectangle is one slice found by binary search, and large boards cost a few bytes per entry.
+# So queries cost about as much as the number of nodes and edges in the queried rectangle.
+MAXEDGECELLS = 64
+class SpatialIndex:
+    def __init__(self, model, cellsize=4*CIRCLESIZE):
+        self.cellsize = cellsize
+        (self.ids, self.xy, amounts) = nodearrays(model)
+        (u, v) = edgearrays(model)
+        self.edgeends = (u, v)
+
+        # cell numbers: column*rows+row, relative to the cell of the top left node
+        if len(self.ids):
+           (self.cx, self.cy) = (int(self.xy[:,0].min()//cellsize), int(self.xy[:,1].min()//cellsize))
+           (cx2, cy2) = (int(self.xy[:,0].max()//cellsize), int(self.xy[:,1].max()//cellsize))
+        else:
+           (self.cx, self.cy, cx2, cy2) = (0, 0, 0, 0)
+        self.columns = cx2-self.cx+1
+        self.rows = cy2-self.cy+1
+        # int32 cell numbers halve the largest arrays, unless the board spans more than 2^31 cells
+        self.celltype = np.int32 if self.columns*self.rows < 1<<31 else np.int64
+
+        # the same positions column by column, for distances
+        self.points = Vec2dArray.fromarray(self.xy)
+        cells = self.cellnumbers(self.xy)
+        self.nodeorder = np.argsort(cells, kind='stable')
+        self.nodecells = cells[self.nodeorder]
+
+        # edge end positions by looking up the array row of each node id
+        self.lookup = np.zeros(int(self.ids.max())+1 if len(self.ids) else 1, dtype=np.int32)
+        self.lookup[self.ids] = np.arange(len(self.ids))
+        # edges per node id, to tell which nodes an edge is the last one of
+        self.degree = np.bincount(u, minlength=len(self.lookup))+np.bincount(v, minlength=len(self.lookup))
+        (a, b) = (self.xy[self.lookup[u]], self.xy[self.lookup[v]])
+        bboxes = np.concatenate((np.minimum(a,b), np.maximum(a,b)), axis=1)
+        del a, b
+        (cx1, cy1, cx2, cy2) = ((bboxes//cellsize).astype(np.int64)-[self.cx, self.cy, self.cx, self.cy]).T
+        (width, height) = (cx2-cx1+1, cy2-cy1+1)
+        long = width*height > MAXEDGECELLS
+        self.longedges = np.flatnonzero(long)
+        # left, top, right and bottom as arrays of their own, comparing contiguous arrays is faster
+        self.longboxes = tuple(np.ascontiguousarray(bboxes[self.longedges,side]) for side in range(4))
+        short = np.flatnonzero(~long)
+        # every short edge once per cell of its bounding box, in chunks to keep the temporary arrays small
+        (edgecells, edgeorder) = ([], [])
+        for chunk in range(0, len(short), 1<<16):
+            edges = short[chunk:chunk+(1<<16)]
+            counts = (width*height)[edges]
+            edge = np.repeat(edges, counts)
+            k = np.arange(len(edge))-np.repeat(np.cumsum(counts)-counts, counts)
+            edgecells.append(((cx1[edge]+k//height[edge])*self.rows + cy1[edge]+k%height[edge]).astype(self.celltype))
+            edgeorder.append(edge.astype(np.int32))
+        cells = np.concatenate(edgecells or [np.zeros(0, dtype=self.celltype)])
+        del edgecells
+        order = np.argsort(cells, kind='stable')
+        self.edgecells = cells[order]
+        del cells
+        self.edgeorder = np.concatenate(edgeorder or [np.zeros(0, dtype=np.int32)])[order]
+
+    def cellnumbers(self, xy):
+        cells = (xy[:,0]//self.cellsize-self.cx).astype(np.int64)*self.rows + (xy[:,1]//self.cellsize-self.cy).astype(np.int64)
+        return cells.astype(self.celltype)
+
+    # entries of the cells overlapping rect, one slice per column
+    def query(self, cells, entries, rect):
+        cx1 = max(int(rect[0]//self.cellsize)-self.cx, 0)
+        cx2 = min(int(rect[2]//self.cellsize)-self.cx, self.columns-1)
+        cy1 = max(int(rect[1]//self.cellsize)-self.cy, 0)
+        cy2 = min(int(rect[3]//self.cellsize)-self.cy, self.rows-1)
+        if cx1>cx2 or cy1>cy2:
+           return entries[:0]
+        columns = np.arange(cx1, cx2+1, dtype=cells.dtype)*self.rows
+        starts = np.searchsorted(cells, columns+cy1)
+        ends = np.searchsorted(cells, columns+cy2, side='right')
+        if len(columns)==1:
+           return entries[starts[0]:ends[0]]
+        return np.concatenate([entries[start:end] for (start, end) in zip(starts.tolist(), ends.tolist()) if start<end] or [entries[:0]])
+
+    # array rows (into ids and xy) of the nodes with a position inside rect
+    def noderows(self, rect):
+        rows = self.query(self.nodecells, self.nodeorder, rect)
+        (x, y) = (self.xy[rows,0], self.xy[rows,1])
+        return rows[(rect[0]<=x) & (x<=rect[2]) & (rect[1]<=y) & (y<=rect[3])]
+
+    # node indexes with a position inside rect
+    def nodes(self, rect):
+        yield from self.ids[self.noderows(rect)].tolist()
+
+    # array rows of the count nodes nearest to pos (all nodes if there are fewer),
+    # looked for in a square around pos growing until it holds enough of them
+    def nearby(self, pos, count):
+        radius = self.cellsize
+        while True:
+            rows = self.noderows((pos[0]-radius, pos[1]-radius, pos[0]+radius, pos[1]+radius))
+            if len(rows)>=count or radius>(self.columns+self.rows)*self.cellsize:
+               break
+            radius *= 2
+        if len(rows)>count:
+           distances = self.points.dist_sqrd(pos, rows)
+           # nodes just outside the square can be nearer than the ones in its corners,
+           # so look again in the square reaching as far as the count-th nearest node
+           radius = math.sqrt(np.partition(distances, count-1)[count-1])
+           rows = self.noderows((pos[0]-radius, pos[1]-radius, pos[0]+radius, pos[1]+radius))
+           distances = self.points.dist_sqrd(pos, rows)
+           rows = rows[np.argpartition(distances, count-1)[:count]]
+        return rows
+
+    # node indexes inside the polygon given by its corner points (even-odd rule), e.g. a lasso
+    def inside(self, polygon):
+        if len(polygon)<3:
+           return []
+        (xs, ys) = zip(*polygon)
+        candidates = self.noderows((min(xs), min(ys), max(xs), max(ys)))
+        (px, py) = (self.xy[candidates,0], self.xy[candidates,1])
+        inside = np.zeros(len(candidates), dtype=bool)
+        # count the crossings of a ray from each point to the right with every polygon side
+        for (x1,y1,x2,y2) in zip(xs, ys, xs[1:]+xs[:1], ys[1:]+ys[:1]):
+            if y1==y2:
+               continue
+            crosses = (py<y1) != (py<y2)
+            inside ^= crosses & (px < x1+(py-y1)*(x2-x1)/(y2-y1))
+        return self.ids[candidates[inside]].tolist()
+
+    # edges with a bounding box overlapping rect, each edge only once.
+    # Short edges are found by the cells they cross, so a few edges just outside rect may come along
+    def edges(self, rect):
+        short = self.query(self.edgecells, self.edgeorder, rect)
+        (left, top, right, bottom) = self.longboxes
+        overlap = left<=rect[2]
+        overlap &= rect[0]<=right
+        overlap &= top<=rect[3]
+        overlap &= rect[1]<=bottom
+        long = self.longedges[overlap]
+        edges = np.unique(np.concatenate((short, long)))
+        (u, v) = self.edgeends
+        return set(zip(u[edges].tolist(), v[edges].tolist()))
+
+    # positions of the given node ids as array
+    def positionsof(self, ids):
+        return self.xy[self.lookup[ids]]
+
+    # the node nearest to pos within the given radius or -1
+    def nearest(self, pos, radius):
+        rows = self.noderows((pos[0]-radius, pos[1]-radius, pos[0]+radius, pos[1]+radius))
+        if not len(rows):
+           return -1
+        distances = self.points.dist_sqrd(pos, rows)
+        # nearest, of equally near ones the lowest node index
+        ids = self.ids[rows]
+        best = np.lexsort((ids, distances))[0]
+        return int(ids[best]) if distances[best]<radius**2 else -1
+
+class View:
+    # without a display the view can still draw (see draw), e.g. for thumbnails
+    def __init__(self, display=True):
+        self.screen = pg.display.set_mode(SCREENSIZE) if display else None
+        # pre-rasterised edge density image for the far level of detail,
+        # it belongs to one spatial index and is rebuilt when the model builds a new one
+        self.density = None
+        # screen area of the profiler overlay drawn last
+        self.overlayrect = None
+
+    # count how many edges pass each pixel of a world aligned grid,
+    # the image gets an alpha channel by the (logarithmic) count in GRAPHCOLOR
+    def densityimage(self, model, index):
+        profiler.hit('density image', not self.density is None and self.density[0] is index)
+        if self.density is None or self.density[0] is not index:
+           (ids, xy) = (index.ids, index.xy)
+           edges = np.stack(index.edgeends, axis=1)
+           if len(ids)==0 or len(edges)==0:
+              self.density = (index, None, (0,0), 1)
+              return self.density[1:]
+           lookup = index.lookup
+           lo = xy.min(axis=0)
+           extent = xy.max(axis=0)-lo
+           cell = max(float(extent.max())/(DENSITYSIZE-1), 1.0)
+           (w,h) = (extent//cell).astype(np.int64)+1
+           counts = np.zeros(w*h, dtype=np.int64)
+           allpixels = np.abs(xy[lookup[edges[:,0]]]-xy[lookup[edges[:,1]]]).max(axis=1)/cell
+           # sample each edge about once per pixel, but no more than DENSITYSAMPLES samples overall
+           step = max(1.0, float(allpixels.sum())/DENSITYSAMPLES)
+           # in chunks to keep the sample arrays small
+           for chunk in range(0, len(edges), 1<<16):
+               a = (xy[lookup[edges[chunk:chunk+(1<<16),0]]]-lo)/cell
+               b = (xy[lookup[edges[chunk:chunk+(1<<16),1]]]-lo)/cell
+               samples = np.ceil(allpixels[chunk:chunk+(1<<16)]/step).astype(np.int64)+1
+               edge = np.repeat(np.arange(len(a)), samples)
+               first = np.repeat(np.cumsum(samples)-samples, samples)
+               t = ((np.arange(len(edge))-first)/np.maximum(samples-1,1)[edge])[:,None]
+               points = (a[edge]+(b[edge]-a[edge])*t).astype(np.int64)
+               # rounding can put the far end just outside
+               np.clip(points, 0, [w-1, h-1], out=points)
+               counts += np.bincount(points[:,0]*h+points[:,1], minlength=w*h)
+           alpha = np.log1p(counts)*(255/np.log1p(counts.max()))
+           image = pg.Surface((int(w),int(h)), pg.SRCALPHA)
+           image.fill(GRAPHCOLOR)
+           pixels = pg.surfarray.pixels_alpha(image)
+           pixels[:] = alpha.reshape(w,h).astype(np.uint8)
+           del pixels
+           self.density = (index, image, (float(lo[0]),float(lo[1])), cell)
+        return self.density[1:]
+
+    # blit the part of the density image inside the viewport, scaled to the screen
+    def drawdensity(self, model, index):
+        (image, lo, cell) = self.densityimage(model, index)
+        if image is None:
+           return
+        camera = model.camera
+        (left, top, right, bottom) = camera.viewport()
+        (w,h) = image.get_size()
+        x1 = max(0, int((left-lo[0])//cell))
+        y1 = max(0, int((top-lo[1])//cell))
+        x2 = min(w, int((right-lo[0])//cell)+1)
+        y2 = min(h, int((bottom-lo[1])//cell)+1)
+        if x1>=x2 or y1>=y2:
+           return
+        part = image.subsurface((x1, y1, x2-x1, y2-y1))
+        size = (max(1,int((x2-x1)*cell*camera.zoom)), max(1,int((y2-y1)*cell*camera.zoom)))
+        model.fg.blit(pg.transform.scale(part, size), camera.toscreen((lo[0]+x1*cell, lo[1]+y1*cell)))
+
+    # nodes as single pixels, colored by debt sign
+    def drawpoints(self, model, index):
+        (ids, xy) = (index.ids, index.xy)
+        camera = model.camera
+        screen = ((xy-camera.offset)*camera.zoom).astype(np.int64)
+        (sw,sh) = model.fg.get_size()
+        inside = (screen[:,0]>=0) & (screen[:,0]<sw) & (screen[:,1]>=0) & (screen[:,1]<sh)
+        screen = screen[inside]
+        amounts = amountsof(model, ids[inside])
+        colors = np.where((amounts<0)[:,None], np.array(REMOVECOLOR[:3]), np.array(DOLLARGREEN[:3]))
+        pixels = pg.surfarray.pixels3d(model.fg)
+        pixels[screen[:,0],screen[:,1]] = colors
+        del pixels
+        pixels = pg.surfarray.pixels_alpha(model.fg)
+        pixels[screen[:,0],screen[:,1]] = 255
+        del pixels
+
+    # node label font in the given (zoomed) size, too small labels are not drawn at all (None)
+    def nodefont(self, size):
+        if size<6:
+           return None
+        return assets.font(NODEFONT, size)
+
     def update(self, model, state):
         if model.draw:
-           (sw,sh) = model.fg.get_size()
+           self.draw(model, state)
+           if model.draw:
+              with profiler.span('blit'):
+                 self.screen.blit(model.bg,(0,0))
+                 self.screen.blit(model.fg,(0,0))
+                 if profiler.overlay:
+                    self.overlayrect = self.screen.blit(self.overlay(), (10,10))
+              with profiler.span('display.update'):
+                 pg.display.update()
 
-           textfont = pg.font.SysFont(TEXTFONT, int(TITLEFONTSIZE/3))
+              model.draw = False
+        elif profiler.overlay:
+           # the board is unchanged, redraw only the overlay and the board below its old and new area
+           with profiler.span('overlay'):
+              overlay = self.overlay()
+              area = overlay.get_rect(topleft=(10,10))
+              if not self.overlayrect is None:
+                 area.union_ip(self.overlayrect)
+              self.screen.blit(model.bg, area, area)
+              self.screen.blit(model.fg, area, area)
+              self.overlayrect = self.screen.blit(overlay, (10,10))
+              pg.display.update(area)
+
+    # draw the board of the model onto model.fg (as seen through model.camera) along with texts for the state.
+    # The 'thumbnail' state is just the board, without texts or highlights
+    def draw(self, model, state):
+        (sw,sh) = model.fg.get_size()
 
-           if state=='game':
-              model.fg.fill((0,0,0,0))
+        textfont = assets.font(TEXTFONT, int(TITLEFONTSIZE/3))
+
+        camera = model.camera
+        index = model.spatialindex()
+        # world rectangle on screen, with a margin for the node circles
+        viewport = camera.viewport(CIRCLESIZE)
+        radius = max(1, int(CIRCLESIZE*camera.zoom))
+        linewidth = max(1, int(5*camera.zoom))
+        circlewidth = min(radius, linewidth)
+        # level of detail by on screen node size:
+        # full detail, nodes without labels or just points and the edge density image
+        lod = 'full' if radius>=LODLABELRADIUS else 'mid' if radius>=LODPOINTRADIUS else 'far'
+        nodefont = self.nodefont(int(.60*TITLEFONTSIZE*camera.zoom)) if lod=='full' else None
+        drawcalls = 0
+        hint = None
+
+        if state in ('game','thumbnail'):
+           model.fg.fill((0,0,0,0))
 
-              # check, if all nodes are positive!
-              for node in model.nodes.values():
-                  if node[1] < 0:
-                    break
+           if state=='game':
+              # check, if all nodes are positive! (the hints know the nodes in debt)
+              if not model.hints is None:
+                 solved = not model.hints.debts
               else:
+                 solved = not any(node[1] < 0 for node in model.nodes.values())
+              if solved:
                   model.solved = True
                   model.reset()
 
-           
+
               if model.solved:
                  text = textfont.render('You solved! Press any key or click to continue.', True, BLACK)
               else:
-                 text = textfont.render('Press any key to give up.', True, BLACK)
+                 text = textfont.render('Press H for a hint, any other key to give up.', True, BLACK)
               (tw,th) = text.get_size()
-              
+
               model.fg.blit(text,((sw-tw)/2,20))
-           
-              for edge in model.edges:
-                  node1 = model.nodes[edge[0]]
-                  node2 = model.nodes[edge[1]]
-                  color = GRAPHCOLOR
+
+              if model.showhints and not model.solved and not model.hints is None:
+                 hint = model.hints.hint()
+                 if model.hints.unsolvable:
+                    text = textfont.render('This board can\'t be solved.', True, BLACK)
+                 elif hint[1]>0:
+                    text = textfont.render('Hint: left click the yellow ringed node to lend.', True, BLACK)
+                 else:
+                    text = textfont.render('Hint: right click the yellow ringed node to borrow.', True, BLACK)
+                 model.fg.blit(text,((sw-text.get_width())/2,30+th))
+
+           profiler.begin('draw edges')
+           if lod=='far':
+              self.drawdensity(model, index)
+           for edge in index.edges(viewport) if lod!='far' else ():
+               node1 = model.nodes[edge[0]]
+               node2 = model.nodes[edge[1]]
+               color = GRAPHCOLOR
                
-                  othernodeindex = -1
-                  if edge[0] == model.nearestnodeindex:
-                     othernodeindex = edge[1]
-                  if edge[1] == model.nearestnodeindex:
-                     othernodeindex = edge[0]
-                  if othernodeindex>=0:
-                     color = HIGHLIGHTCOLOR
+               othernodeindex = -1
+               if edge[0] == model.nearestnodeindex:
+                  othernodeindex = edge[1]
+               if edge[1] == model.nearestnodeindex:
+                  othernodeindex = edge[0]
+               if othernodeindex>=0:
+                  color = HIGHLIGHTCOLOR
                
-                  pg.draw.line(model.fg, color, node1[0], node2[0],5)
+               pg.draw.line(model.fg, color, camera.toscreen(node1[0]), camera.toscreen(node2[0]), linewidth)
+               drawcalls += 1
+           profiler.end('draw edges')
                   
-           if state=='editor':
-              model.fg.fill((0,0,0,0))           
+        if state=='editor':
+           model.fg.fill((0,0,0,0))           
               
-              text = textfont.render('Press S to save the game.', True, BLACK)
-              (tw,th) = text.get_size()
-              model.fg.blit(text,((sw-tw)/2,20))
+           text = textfont.render('Press S to save the game, L to arrange the nodes.', True, BLACK)
+           (tw,th) = text.get_size()
+           model.fg.blit(text,((sw-tw)/2,20))
            
-              text = textfont.render('Press any other key to start the game.', True, BLACK)
-              (tw,th) = text.get_size()
-              model.fg.blit(text,((sw-tw)/2,30+th))
+           text = textfont.render('Press any other key to start the game.', True, BLACK)
+           (tw,th) = text.get_size()
+           model.fg.blit(text,((sw-tw)/2,30+th))
 
-              text = textfont.render('click to create or delete node or edge, nodes can be dragged.', True, BLACK)
-              (tw,th) = text.get_size()
-              model.fg.blit(text,(10,sh-th-10))
+           text = textfont.render('click to create or delete node or edge, nodes can be dragged.', True, BLACK)
+           (tw,th) = text.get_size()
+           model.fg.blit(text,(10,sh-th-10))
 
-              #text = textfont.render('nearest node index:'+str(model.nearestnodeindex), True, BLACK)
-              #(tw,th) = text.get_size()
-              #model.fg.blit(text,(10,sh-th-36))
-           
-              nearestedgeexists = False
-              for edge in model.edges:
-                    if not(model.nearestedge is None) and edge == model.nearestedge:
-                       pg.draw.line(model.fg, REMOVECOLOR, model.nodes[edge[0]][0],model.nodes[edge[1]][0],5)
-                       nearestedgeexists = True
-                    else:
-                       node1 = model.nodes[edge[0]]
-                       node2 = model.nodes[edge[1]]
-                       pg.draw.line(model.fg, GRAPHCOLOR, node1[0],node2[0],5)
-              if not model.nearestedge is None and not nearestedgeexists:
-                 pg.draw.line(model.fg, ADDCOLOR, model.nodes[model.nearestedge[0]][0]
-                                                     , model.nodes[model.nearestedge[1]][0],5)
-
-              model.removenodeindex = -1
-              if nearestedgeexists:
-                 # check whether a node become standalone, if the edge is removed.
-                 # if so, mark this nodes with REMOVECOLOR, too.
-                 otheredges = [e for e in model.edges if not e==model.nearestedge and (e[0]==model.nearestedge[0] or e[1]==model.nearestedge[0])]
-                 if len(otheredges)==0:
-                    model.removenodeindex = model.nearestedge[0]
-                 
-                 otheredges = [e for e in model.edges if not e==model.nearestedge and (e[0]==model.nearestedge[1] or e[1]==model.nearestedge[1])]
-                 if len(otheredges)==0:
-                    model.removenodeindex = model.nearestedge[1]
-
-              genus = len(model.edges)-len(model.nodes)+1
-              nodes = 0
-              dollars = 0
-              for (node,nodeamount) in model.nodes.values():
-                 nodes+=1
-                 dollars+=nodeamount
-              
-              text = textfont.render('Genus:'+str(genus)+' Dollars:'+str(dollars), True, BLACK)
-              (tw,th) = text.get_size()
-              model.fg.blit(text,(sw-tw-10,sh-th-10))
+           text = textfont.render('shift/ctrl drag selects nodes, drag them to move, with shift to scale, with ctrl to rotate.', True, BLACK)
+           model.fg.blit(text,(10,sh-2*th-16))
 
-              latestnode = None
-              for latestnodeindex in range(model.nodeidcounter,-1,-1):
-                 try:
-                    latestnode = model.nodes[latestnodeindex][0]
-                    break
-                 except:
-                    continue
+           #text = textfont.render('nearest node index:'+str(model.nearestnodeindex), True, BLACK)
+           #(tw,th) = text.get_size()
+           #model.fg.blit(text,(10,sh-th-36))
+           
+           nearestedgeexists = not model.nearestedge is None and model.nearestedge in model.edges
+           profiler.begin('draw edges')
+           if lod=='far':
+              self.drawdensity(model, index)
+           for edge in index.edges(viewport) if lod!='far' else ():
+                 if edge != model.nearestedge:
+                    node1 = model.nodes[edge[0]]
+                    node2 = model.nodes[edge[1]]
+                    pg.draw.line(model.fg, GRAPHCOLOR, camera.toscreen(node1[0]), camera.toscreen(node2[0]), linewidth)
+                    drawcalls += 1
+           profiler.end('draw edges')
+           if not model.nearestedge is None:
+              pg.draw.line(model.fg, REMOVECOLOR if nearestedgeexists else ADDCOLOR
+                                   , camera.toscreen(model.nodes[model.nearestedge[0]][0])
+                                   , camera.toscreen(model.nodes[model.nearestedge[1]][0]), linewidth)
+
+           model.removenodeindex = -1
+           if nearestedgeexists:
+              # check whether a node become standalone, if the edge is removed.
+              # if so, mark this nodes with REMOVECOLOR, too.
+              if index.degree[model.nearestedge[0]]==1:
+                 model.removenodeindex = model.nearestedge[0]
+              if index.degree[model.nearestedge[1]]==1:
+                 model.removenodeindex = model.nearestedge[1]
+
+           genus = len(model.edges)-len(model.nodes)+1
+           dollars = dollarsum(model)
+
+           text = textfont.render('Genus:'+str(genus)+' Dollars:'+str(dollars), True, BLACK)
+           (tw,th) = text.get_size()
+           model.fg.blit(text,(sw-tw-10,sh-th-10))
+
+           latestnode = None
+           for latestnodeindex in range(model.nodeidcounter,-1,-1):
+              try:
+                 latestnode = model.nodes[latestnodeindex][0]
+                 break
+              except:
+                 continue
                  
 
-              if model.nearestedge is None and model.nearestnodeindex<0 and not model.newnode is None:
-                 if not latestnode is None:
-                    pg.draw.line(model.fg, ADDCOLOR, latestnode, model.newnode,5)
+           if model.nearestedge is None and model.nearestnodeindex<0 and not model.newnode is None:
+              newnode = camera.toscreen(model.newnode)
+              if not latestnode is None:
+                 pg.draw.line(model.fg, ADDCOLOR, camera.toscreen(latestnode), newnode, linewidth)
                     
-                 pg.draw.circle(model.fg, TRANSPARENTCOLOR, model.newnode, CIRCLESIZE)
-                 pg.draw.circle(model.fg, ADDCOLOR, model.newnode, CIRCLESIZE, 5)
-                 myfont = pg.font.Font(NODEFONT, int(.60*TITLEFONTSIZE))
-                 amount = myfont.render(str(0), True, ADDCOLOR)
-                 model.fg.blit(amount,(model.newnode[0]-amount.get_width()/2,model.newnode[1]-amount.get_height()/2+5))
-
-           if state!='title':         
-              for (node,nodeamount) in model.nodes.values():
-                 pg.draw.circle(model.fg, TRANSPARENTCOLOR, node, CIRCLESIZE)
-                 if   model.nearestnodeindex>=0 and node == model.nodes[model.nearestnodeindex][0]:
-                      color = HIGHLIGHTCOLOR
-                 elif model.removenodeindex>=0  and node == model.nodes[model.removenodeindex ][0]:
-                      color = REMOVECOLOR
-                 else:
-                      color = GRAPHCOLOR
-                 pg.draw.circle(model.fg, color, node, CIRCLESIZE, 5)
-                 myfont = pg.font.Font(NODEFONT, int(.60*TITLEFONTSIZE))
-                 amount = myfont.render(str(nodeamount), True, color)
-                 model.fg.blit(amount,(node[0]-amount.get_width()/2,node[1]-amount.get_height()/2+5))
-
-
-           if model.draw:
-              self.screen.blit(model.bg,(0,0))
-              self.screen.blit(model.fg,(0,0))
-              pg.display.update()
-
-              model.draw = False
+              pg.draw.circle(model.fg, TRANSPARENTCOLOR, newnode, radius)
+              pg.draw.circle(model.fg, ADDCOLOR, newnode, radius, circlewidth)
+              if not nodefont is None:
+                 amount = nodefont.render(str(0), True, ADDCOLOR)
+                 model.fg.blit(amount,(newnode[0]-amount.get_width()/2,newnode[1]-amount.get_height()/2+5*camera.zoom))
+
+        profiler.begin('draw nodes')
+        if state!='title' and lod=='far':
+           self.drawpoints(model, index)
+           if state=='editor' and not model.selection is None:
+              for nodeindex in index.nodes(viewport):
+                  if nodeindex in model.selection:
+                     pg.draw.circle(model.fg, SELECTCOLOR, camera.toscreen(model.nodes[nodeindex][0]), LODPOINTRADIUS, 1)
+           if model.nearestnodeindex>=0:
+              pg.draw.circle(model.fg, HIGHLIGHTCOLOR, camera.toscreen(model.nodes[model.nearestnodeindex][0]), LODPOINTRADIUS, 1)
+        elif state!='title':         
+           for nodeindex in index.nodes(viewport):
+              (node,nodeamount) = model.nodes[nodeindex]
+              node = camera.toscreen(node)
+              pg.draw.circle(model.fg, TRANSPARENTCOLOR, node, radius)
+              if   nodeindex == model.nearestnodeindex:
+                   color = HIGHLIGHTCOLOR
+              elif nodeindex == model.removenodeindex:
+                   color = REMOVECOLOR
+              elif state=='editor' and not model.selection is None and nodeindex in model.selection:
+                   color = SELECTCOLOR
+              else:
+                   color = GRAPHCOLOR
+              pg.draw.circle(model.fg, color, node, radius, circlewidth)
+              drawcalls += 2
+              if not nodefont is None:
+                 amount = nodefont.render(str(nodeamount), True, color)
+                 model.fg.blit(amount,(node[0]-amount.get_width()/2,node[1]-amount.get_height()/2+5*camera.zoom))
+                 drawcalls += 1
+        profiler.end('draw nodes')
+
+        if not hint is None:
+           ring = radius+2*linewidth if lod!='far' else LODPOINTRADIUS+3
+           pg.draw.circle(model.fg, HINTCOLOR, camera.toscreen(model.nodes[hint[0]][0]), ring, max(1, circlewidth))
+
+        if state=='editor' and not model.band is None:
+           points = [camera.toscreen(point) for point in model.band[1]]
+           if model.band[0]=='rect':
+              ((x1,y1),(x2,y2)) = (points[0], points[-1])
+              pg.draw.rect(model.fg, SELECTCOLOR, (min(x1,x2), min(y1,y2), abs(x2-x1)+1, abs(y2-y1)+1), 1)
+           elif len(points)>1:
+              pg.draw.lines(model.fg, SELECTCOLOR, True, points, 1)
+
+        profiler.count('draw calls', drawcalls)
+
+    # profiler statistics for the top left corner
+    def overlay(self):
+        textfont = assets.font(TEXTFONT, 16)
+        lines = profiler.lines()
+        width = max(textfont.size(line)[0] for line in lines)+20
+        height = len(lines)*textfont.get_linesize()+20
+        overlay = pg.Surface((width, height), pg.SRCALPHA)
+        overlay.fill((0,0,0,160))
+        for (i, line) in enumerate(lines):
+            overlay.blit(textfont.render(line, True, HIGHLIGHTCOLOR), (10, 10+i*textfont.get_linesize()))
+        return overlay
         
+# Recording and replaying sessions
+# A recording is a gzip compressed stream of pickles: first a header with the starting board and the seed
+# of rng, then one (time, events) pair per frame of Controller.main_event_loop.
+# Replaying feeds the same events frame by frame through Controller.doevent and updates after each frame,
+# so with the same seed, board and input (and layout iterations per frame) the session runs exactly the same.
+RECORDINGVERSION = 1
+RECORDEDEVENTS = (pg.QUIT, pg.KEYDOWN, pg.KEYUP, pg.MOUSEMOTION, pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP)
+
+# just the event attributes the game uses, as a tuple
+def encodeevent(event):
+    if event.type == pg.MOUSEMOTION:
+       return (event.type, tuple(event.pos), tuple(event.rel), tuple(event.buttons))
+    elif event.type in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP):
+       return (event.type, tuple(event.pos), event.button)
+    elif event.type in (pg.KEYDOWN, pg.KEYUP):
+       return (event.type, event.key, event.mod)
+    else:
+       return (event.type,)
+
+def decodeevent(data):
+    if data[0] == pg.MOUSEMOTION:
+       return pg.event.Event(data[0], pos=data[1], rel=data[2], buttons=data[3])
+    elif data[0] in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP):
+       return pg.event.Event(data[0], pos=data[1], button=data[2])
+    elif data[0] in (pg.KEYDOWN, pg.KEYUP):
+       return pg.event.Event(data[0], key=data[1], mod=data[2])
+    else:
+       return pg.event.Event(data[0])
+
+class Recorder:
+    def __init__(self, filename, model, state, seed=None):
+        if seed is None:
+           seed = int.from_bytes(os.urandom(4), 'little')
+        rng.seed(seed)
+        self.file = gzip.open(filename, 'wb')
+        self.start = time.perf_counter()
+        pickle.dump({'version': RECORDINGVERSION,
+                     'seed': seed,
+                     'state': state,
+                     'nodes': model.nodes,
+                     'edges': model.edges,
+                     'nodeidcounter': model.nodeidcounter,
+                     'camera': (model.camera.offset, model.camera.zoom),
+                     # a layout still running (of a loaded board) moves the nodes during the replay just the same
+                     'layout': None if model.layout is None else model.layout.state()}, self.file)
+
+    def frame(self, events):
+        pickle.dump((time.perf_counter()-self.start, [encodeevent(event) for event in events if event.type in RECORDEDEVENTS]), self.file)
+
+    def close(self):
+        self.file.close()
+
+class Replay:
+    def __init__(self, filename):
+        self.file = gzip.open(filename, 'rb')
+        self.header = pickle.load(self.file)
+        if self.header['version'] != RECORDINGVERSION:
+           raise ValueError('unknown recording version '+str(self.header['version']))
+
+    # put the recorded starting board into the model and seed rng like the recording did
+    def setup(self, model):
+        rng.seed(self.header['seed'])
+        model.nodes = self.header['nodes']
+        model.edges = self.header['edges']
+        model.nodeidcounter = self.header['nodeidcounter']
+        (model.camera.offset, model.camera.zoom) = self.header['camera']
+        model.invalidate()
+        model.layout = None
+        if not self.header.get('layout') is None:
+           model.layout = Layout.restore(model, self.header['layout'])
+
+    # (time, events) per frame
+    def __iter__(self):
+        while True:
+            try:
+               (timestamp, events) = pickle.load(self.file)
+            except EOFError:
+               return
+            yield (timestamp, [decodeevent(data) for data in events])
+
+    def close(self):
+        self.file.close()
+
+# Loading and saving boards in the formats of boardio (edge lists, DIMACS, GraphML, JSON)
+# Nodes without positions are placed on a grid in breadth first order, so neighbours start out near each other,
+# and then (for not too large boards) untangled by the force directed layout.
+def edgearray(board):
+    keys = np.fromiter(board.edgekeys, dtype=np.int64, count=len(board.edgekeys))
+    return np.stack((keys>>32, keys&0xffffffff), axis=1)
+
+def placenodes(board):
+    missing = [nodeid for (nodeid, position) in enumerate(board.positions) if position is None]
+    if not missing:
+       return None
+    # adjacency as sorted arrays (CSR), built with numpy to cope with millions of edges
+    edges = edgearray(board)
+    ends = np.concatenate((edges, edges[:,::-1]))
+    ends = ends[np.argsort(ends[:,0], kind='stable')]
+    starts = np.searchsorted(ends[:,0], np.arange(len(board)+1))
+    neighbours = ends[:,1]
+    del edges, ends
+
+    # below the already positioned nodes, if there are any
+    placed = [position for position in board.positions if not position is None]
+    (left, top) = (min(p[0] for p in placed), max(p[1] for p in placed)+3*CIRCLESIZE) if placed else (0, 0)
+    spacing = 3*CIRCLESIZE
+    columns = max(1, int(math.sqrt(len(missing)*4/3)))
+    visited = np.ones(len(board), dtype=bool)
+    visited[missing] = False
+    order = deque()
+    count = 0
+    for start in missing:
+        if visited[start]:
+           continue
+        visited[start] = True
+        order.append(start)
+        while order:
+            nodeid = order.popleft()
+            board.positions[nodeid] = (left+(count%columns)*spacing, top+(count//columns)*spacing)
+            count += 1
+            for neighbour in neighbours[starts[nodeid]:starts[nodeid+1]].tolist():
+                if not visited[neighbour]:
+                   visited[neighbour] = True
+                   order.append(neighbour)
+    rows = (count+columns-1)//columns
+    return (left, top, left+columns*spacing, top+rows*spacing)
+
+# loaded boards are kept compact (see CompactNodes), boards needing more than MAXBOARDBYTES are refused
+def loadboard(model, filename, fmt=None):
+    board = boardio.read(filename, fmt)
+    size = boardbytes(len(board), len(board.edgekeys))
+    if size > MAXBOARDBYTES:
+       raise ValueError('%s: %d nodes and %d edges need about %d MB, more than MAXBOARDBYTES (%d MB)'
+                        % (filename, len(board), len(board.edgekeys), size>>20, MAXBOARDBYTES>>20))
+    placed = placenodes(board)
+    edges = edgearray(board)
+    board.edgekeys = None
+    model.nodes = CompactNodes(board.positions, board.amounts)
+    model.edges = CompactEdges(len(board), edges[:,0], edges[:,1])
+    model.nodeidcounter = len(board)
+    model.layout = None
+    model.invalidate()
+    fitcamera(model)
+    if not placed is None and len(model.nodes)<=LAYOUTMAXNODES:
+       model.layout = Layout(model, bounds=placed)
+
+# let the camera show the whole board
+def fitcamera(model):
+    if model.nodes:
+       (ids, xy, amounts) = nodearrays(model)
+       (left, top) = xy.min(axis=0).tolist()
+       (right, bottom) = xy.max(axis=0).tolist()
+       model.camera.fit((left-CIRCLESIZE, top-CIRCLESIZE, right+CIRCLESIZE, bottom+CIRCLESIZE))
+
+def saveboard(model, filename, fmt=None):
+    boardio.write(filename, sorted(model.nodes.items()), model.edges, fmt)
+
 class Controller:
     def __init__(self):
         pg.init()
@@ -628,8 +2131,9 @@ class Controller:
         pg.display.set_caption("Dollar Game")
         pg.mouse.set_visible(1)
         self.done = False
-        self.model = Model()
+        # the view sets the display mode, which is needed to convert the images the model loads
         self.view = View()
+        self.model = Model()
 
         try:
            with open('dollargame.sav','rb') as savegame:
@@ -638,6 +2142,9 @@ class Controller:
                 self.model.nodeidcounter = pickle.load(savegame)
         except:
            pass
+        self.model.invalidate()
+        self.panning = False
+        self.recorder = None
         
     def setup_states(self, state_dict, start_state):
         self.state_dict = state_dict
@@ -653,28 +2160,129 @@ class Controller:
     def update(self):
         if self.state.done:
            self.flip_state()
-        self.view.update(self.model, self.state_name)
+        if not self.model.selection is None:
+           self.model.selection.step(self.model)
+        if not self.model.layout is None:
+           with profiler.span('layout'):
+              self.model.layout.step(self.model, LAYOUTSTEPS)
+           if self.model.layout.done:
+              self.model.layout = None
+        with profiler.span('view.update', self.state_name):
+           self.view.update(self.model, self.state_name)
+        profiler.frame()
     def event_loop(self):
         pg.time.delay(10)
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-               self.done = True
-            self.state.doevent(event, self.model)
+        with profiler.span('event_loop'):
+           events = pg.event.get()
+           if not self.recorder is None:
+              self.recorder.frame(events)
+           for event in events:
+               self.doevent(event)
+
+    # a single event, live or synthetic
+    def doevent(self, event):
+        if event.type == pg.QUIT:
+           self.done = True
+        profiler.count('events')
+        self.model.mouse.update(event)
+        if self.camera_event(event):
+           return
+        if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+           # F3 shows or hides the profiler overlay
+           profiler.toggleoverlay()
+           self.model.draw = True
+           return
+        with profiler.span('doevent', event.type):
+           self.state.doevent(event, self.model)
+
+    # mouse wheel zooms, dragging with the middle mouse button pans.
+    # returns True for events only meant for the camera, which the states don't get to see
+    def camera_event(self, event):
+        camera = self.model.camera
+        if event.type in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP) and event.button in (2,4,5):
+           if event.type == pg.MOUSEBUTTONDOWN:
+              if event.button == 2:
+                 self.panning = True
+              else:
+                 camera.zoomat(event.pos, ZOOMSTEP if event.button == 4 else 1/ZOOMSTEP)
+                 self.model.draw = True
+           elif event.button == 2:
+              self.panning = False
+           return True
+        if event.type == pg.MOUSEMOTION and self.panning:
+           camera.pan(event.rel)
+           self.model.draw = True
+           # the states still see this motion to update what's hovered
+        return False
 
     def main_event_loop(self):
         while not self.done:
             self.event_loop()
             self.update()
 
+    # the same as main_event_loop, but with recorded events, frame by frame.
+    # Frames are played at their recorded time or, if fast, without any waiting
+    def replay_event_loop(self, replay, fast=False):
+        start = time.perf_counter()
+        for (timestamp, events) in replay:
+            if not fast:
+               wait = timestamp-(time.perf_counter()-start)
+               if wait>0:
+                  pg.time.wait(int(wait*1000))
+            # live events are dropped, except for closing the window or escape, which end the replay
+            for event in pg.event.get():
+                if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                   self.done = True
+            if self.done:
+               break
+            for event in events:
+                self.doevent(event)
+            self.update()
+            if self.done:
+               break
+
 def main():
+    parser = argparse.ArgumentParser(description='The Dollar Game')
+    parser.add_argument('--record', metavar='FILE', help='record the session (board and input) to FILE')
+    parser.add_argument('--replay', metavar='FILE', help='replay a recorded session')
+    parser.add_argument('--fast', action='store_true', help='replay as fast as possible instead of at recorded speed')
+    parser.add_argument('--profile', metavar='FILE', help='write a Chrome trace timeline of the session to FILE')
+    parser.add_argument('--load', metavar='FILE', help='load a board (edge list, DIMACS, GraphML, JSON, see boardio.py)')
+    parser.add_argument('--export', metavar='FILE', help='write the board to FILE when the game ends (format by extension)')
+    args = parser.parse_args()
+    if args.profile:
+       profiler.tracing()
+
     app = Controller()
     state_dict = {
         'title' : Title(),
         'editor': Editor(),
         'game'  : Game()
     }
-    app.setup_states(state_dict, 'title')
-    app.main_event_loop()
+    if args.load:
+       loadboard(app.model, args.load)
+    if args.replay:
+       replay = Replay(args.replay)
+       replay.setup(app.model)
+       try:
+          app.setup_states(state_dict, replay.header['state'])
+          app.replay_event_loop(replay, args.fast)
+       finally:
+          replay.close()
+    else:
+       if args.record:
+          app.recorder = Recorder(args.record, app.model, 'title')
+       try:
+          app.setup_states(state_dict, 'title')
+          app.main_event_loop()
+       finally:
+          # what was recorded until an error is still a valid recording
+          if args.record:
+             app.recorder.close()
+    if args.profile:
+       profiler.dump(args.profile)
+    if args.export:
+       saveboard(app.model, args.export)
 
     pg.quit()
     sys.exit()
@@ -1037,5 +2645,85 @@ class Vec2d(object):
         self.x, self.y = dict
 
 
+# Geometry kernel for hit testing: plain floats in, plain floats out, no Vec2d objects
+# and no square roots, distances are compared squared.
+
+def dist_sqrd(ax, ay, bx, by):
+    return (bx-ax)*(bx-ax) + (by-ay)*(by-ay)
+
+# squared distance from point p to its perpendicular foot on the segment a-b,
+# infinite if the foot lies outside the segment (or the segment has no length)
+def segment_dist_sqrd(px, py, ax, ay, bx, by):
+    ex = bx-ax
+    ey = by-ay
+    length = ex*ex + ey*ey
+    if length==0:
+       return math.inf
+    t = ((px-ax)*ex + (py-ay)*ey)/length
+    if t<0 or t>1:
+       return math.inf
+    dx = ax+t*ex-px
+    dy = ay+t*ey-py
+    return dx*dx + dy*dy
+
+# many points in two contiguous float arrays, for the same geometry on all of them at once
+class Vec2dArray:
+    __slots__ = ['x', 'y']
+
+    def __init__(self, points=()):
+        points = list(points)
+        self.x = np.fromiter((point[0] for point in points), dtype=np.float64, count=len(points))
+        self.y = np.fromiter((point[1] for point in points), dtype=np.float64, count=len(points))
+
+    # the points of an array of x,y rows (like SpatialIndex.xy), column by column
+    @classmethod
+    def fromarray(cls, xy):
+        points = cls()
+        points.x = np.ascontiguousarray(xy[:,0], dtype=np.float64)
+        points.y = np.ascontiguousarray(xy[:,1], dtype=np.float64)
+        return points
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        return (float(self.x[index]), float(self.y[index]))
+
+    # dist_sqrd from point to all points, or to the points at the given rows only
+    def dist_sqrd(self, point, rows=None):
+        (x, y) = (self.x, self.y) if rows is None else (self.x[rows], self.y[rows])
+        dx = x-point[0]
+        dx *= dx
+        dy = y-point[1]
+        dy *= dy
+        dx += dy
+        return dx
+
+    # segment_dist_sqrd for the segments from point index to each point from index start on,
+    # written into out if given (a float array of len(self)-start), so repeated calls can share one
+    def segment_dist_sqrd(self, point, index, start=0, out=None):
+        (ax, ay) = (self.x[index], self.y[index])
+        ex = self.x[start:]-ax
+        ey = self.y[start:]-ay
+        length = ex*ex
+        length += ey*ey
+        t = np.multiply(point[0]-ax, ex, out=out)
+        t += (point[1]-ay)*ey
+        with np.errstate(divide='ignore', invalid='ignore'):
+             t /= length
+        outside = ~((t>=0) & (t<=1)) # also the segments without length, their t is nan
+        # in the same order as segment_dist_sqrd, so both give the same floats
+        ex *= t
+        ex += ax
+        ex -= point[0]
+        ey *= t
+        ey += ay
+        ey -= point[1]
+        np.multiply(ex, ex, out=t)
+        t += ey*ey
+        t[outside] = math.inf
+        return t
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,277 @@
+"""
+Dollar Game board server
+
+Hosts many independent Dollar Game sessions in one process, played over a line delimited JSON protocol
+on a TCP or Unix socket. Every request is one JSON object on one line, every response as well:
+
+   {"op": "load", "dollars": [-2, 1, 3], "edges": [[0,1],[1,2],[2,0]]}  ->  {"ok": true, "session": "..."}
+   {"op": "fire", "session": "...", "node": 2}        node 2 lends a dollar along each of its edges
+   {"op": "borrow", "session": "...", "node": 0}      node 0 borrows a dollar along each of its edges
+   {"op": "undo", "session": "..."}                   takes back the latest fire or borrow
+   {"op": "query", "session": "..."}                  dollars, genus, moves and whether the board is solved
+   {"op": "close", "session": "..."}                  ends the session
+   {"op": "stats"}                                    server statistics
+
+fire and borrow take an optional "times" (default 1). Errors are answered with {"ok": false, "error": "..."}.
+Sessions outlive connections, they are evicted when idle for too long or, least recently used first,
+when there are too many. Board size and undo history are bounded per session.
+
+   python dollarserver.py serve --port 8642        (or --unix /tmp/dollargame.sock)
+   python dollarserver.py load --port 8642 --connections 50 --sessions 1000 --requests 100000
+"""
+
+import json, time, asyncio, argparse, uuid
+from collections import OrderedDict, deque
+from random import Random
+
+PORT = 8642
+MAXSESSIONS = 10000
+MAXNODES = 100000 # per session
+MAXEDGES = 500000 # per session
+MAXHISTORY = 1000 # undo steps per session
+MAXTIMES = 1<<20 # most firings of a node in one fire or borrow request
+MAXDOLLARS = 1<<53 # most dollars (or debt) of a node when loading, clients reading JSON numbers as doubles get them exactly
+IDLETIMEOUT = 600 # seconds until an untouched session is evicted
+MAXLINE = 64<<20 # longest request line in bytes, large boards are loaded in one line
+
+# One board, played like the Game state plays it (see Game.doevent in dollargame.py):
+# firing a node moves one dollar along each of its edges, from the node (lend) or to the node (borrow).
+class Session:
+    def __init__(self, dollars, edges):
+        if not isinstance(dollars, list) or not isinstance(edges, list):
+           raise ValueError('dollars and edges must be lists')
+        if len(dollars)>MAXNODES or len(edges)>MAXEDGES:
+           raise ValueError('board too large, at most %d nodes and %d edges' % (MAXNODES, MAXEDGES))
+        self.dollars = [whole(amount, 'dollars', -MAXDOLLARS, MAXDOLLARS) for amount in dollars]
+        # neighbours per node, an edge listed twice counts twice like in the game
+        self.neighbours = [[] for amount in self.dollars]
+        for edge in edges:
+            if not isinstance(edge, list) or len(edge)!=2:
+               raise ValueError('an edge must be a list of two nodes, not %s' % json.dumps(edge))
+            (node1, node2) = (whole(node, 'edge node', 0, len(self.dollars)-1) for node in edge)
+            if node1==node2:
+               raise ValueError('invalid edge %s' % [node1, node2])
+            self.neighbours[node1].append(node2)
+            self.neighbours[node2].append(node1)
+        self.edgecount = len(edges)
+        self.history = deque(maxlen=MAXHISTORY)
+        self.moves = 0
+        self.debts = sum(1 for amount in self.dollars if amount<0) # nodes in debt, so solved is O(1)
+        self.touched = time.monotonic()
+
+    def change(self, node, amount):
+        before = self.dollars[node]
+        self.dollars[node] = before+amount
+        self.debts += (before+amount<0)-(before<0)
+
+    # amount 1 lends, -1 borrows
+    def fire(self, node, amount):
+        if not 0<=node<len(self.dollars):
+           raise ValueError('no node %s' % node)
+        self.change(node, -amount*len(self.neighbours[node]))
+        for neighbour in self.neighbours[node]:
+            self.change(neighbour, amount)
+
+    def play(self, node, amount):
+        self.fire(node, amount)
+        self.history.append((node, amount))
+        self.moves += 1
+
+    def undo(self):
+        if not self.history:
+           raise ValueError('nothing to undo')
+        (node, amount) = self.history.pop()
+        self.fire(node, -amount)
+        self.moves -= 1
+
+    def query(self):
+        return {'dollars': self.dollars,
+                'genus': self.edgecount-len(self.dollars)+1,
+                'moves': self.moves,
+                'solved': self.debts==0}
+
+# a whole number from a request within bounds, JSON also allows floats like 1e999
+def whole(value, name, low, high):
+    if isinstance(value, bool) or not isinstance(value, int) or not low<=value<=high:
+       raise ValueError('%s must be a whole number from %d to %d' % (name, low, high))
+    return value
+
+class Server:
+    def __init__(self, maxsessions=MAXSESSIONS, idletimeout=IDLETIMEOUT):
+        self.sessions = OrderedDict() # least recently used first
+        self.maxsessions = maxsessions
+        self.idletimeout = idletimeout
+        self.requests = 0
+        self.evicted = 0
+        self.connections = 0
+
+    def session(self, request):
+        sessionid = request.get('session')
+        session = self.sessions.get(sessionid)
+        if session is None:
+           raise ValueError('no session %s' % sessionid)
+        self.sessions.move_to_end(sessionid)
+        session.touched = time.monotonic()
+        return session
+
+    def handle(self, request):
+        self.requests += 1
+        op = request.get('op')
+        if op=='load':
+           session = Session(request['dollars'], request.get('edges', []))
+           # always a new id, so no client can replace the session of another one
+           sessionid = uuid.uuid4().hex
+           while len(self.sessions)>=self.maxsessions:
+               self.sessions.popitem(last=False)
+               self.evicted += 1
+           self.sessions[sessionid] = session
+           return {'ok': True, 'session': sessionid}
+        elif op in ('fire','borrow'):
+           session = self.session(request)
+           times = whole(request.get('times', 1), 'times', -MAXTIMES, MAXTIMES)
+           session.play(whole(request['node'], 'node', 0, len(session.dollars)-1), times if op=='fire' else -times)
+           return {'ok': True, 'solved': session.debts==0}
+        elif op=='undo':
+           session = self.session(request)
+           session.undo()
+           return {'ok': True, 'solved': session.debts==0}
+        elif op=='query':
+           response = self.session(request).query()
+           response['ok'] = True
+           return response
+        elif op=='close':
+           self.session(request)
+           del self.sessions[request['session']]
+           return {'ok': True}
+        elif op=='stats':
+           return {'ok': True, 'sessions': len(self.sessions), 'requests': self.requests,
+                   'evicted': self.evicted, 'connections': self.connections}
+        raise ValueError('unknown op %s' % op)
+
+    async def client(self, reader, writer):
+        self.connections += 1
+        try:
+           while True:
+               try:
+                  line = await reader.readline()
+               except ValueError:
+                  # longer than MAXLINE, the rest of the stream can't be trusted
+                  writer.write(b'{"ok": false, "error": "request too long"}\n')
+                  break
+               if not line:
+                  break
+               try:
+                  response = self.handle(json.loads(line))
+               except (ValueError, KeyError, TypeError, AttributeError, OverflowError) as error:
+                  response = {'ok': False, 'error': str(error)}
+               writer.write(json.dumps(response).encode()+b'\n')
+               await writer.drain()
+        except ConnectionError:
+           pass
+        finally:
+           self.connections -= 1
+           writer.close()
+
+    async def evict(self):
+        while True:
+            await asyncio.sleep(max(1, self.idletimeout/10))
+            idle = time.monotonic()-self.idletimeout
+            # least recently used first, so stop at the first one still in use
+            while self.sessions and next(iter(self.sessions.values())).touched<idle:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+
+    async def serve(self, host='localhost', port=PORT, unix=None):
+        if unix:
+           server = await asyncio.start_unix_server(self.client, unix, limit=MAXLINE)
+        else:
+           server = await asyncio.start_server(self.client, host, port, limit=MAXLINE)
+        eviction = asyncio.ensure_future(self.evict())
+        try:
+           async with server:
+                await server.serve_forever()
+        finally:
+           eviction.cancel()
+
+###### load generator
+
+async def connect(args):
+    if args.unix:
+       return await asyncio.open_unix_connection(args.unix, limit=MAXLINE)
+    return await asyncio.open_connection(args.host, args.port, limit=MAXLINE)
+
+async def request(reader, writer, message):
+    writer.write(json.dumps(message).encode()+b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+# a random connected board like the editor generates: a path through all nodes plus some more edges
+def randomboard(rng, nodes):
+    edges = [[n-1, n] for n in range(1, nodes)]
+    edges += [[rng.randrange(nodes), rng.randrange(nodes)] for n in range(nodes>>1)]
+    edges = [edge for edge in edges if edge[0]!=edge[1]]
+    dollars = [rng.randint(-3,3) for n in range(nodes)]
+    return {'op': 'load', 'dollars': dollars, 'edges': edges}
+
+async def loadclient(args, number, sessions, requests, latencies):
+    rng = Random(args.seed+number)
+    (reader, writer) = await connect(args)
+    sessionids = []
+    for n in range(sessions):
+        start = time.perf_counter()
+        response = await request(reader, writer, randomboard(rng, args.nodes))
+        latencies['load'].append(time.perf_counter()-start)
+        sessionids.append(response['session'])
+    for n in range(requests):
+        sessionid = rng.choice(sessionids)
+        op = rng.choice(('fire','borrow','fire','borrow','query','undo'))
+        message = {'op': op, 'session': sessionid}
+        if op in ('fire','borrow'):
+           message['node'] = rng.randrange(args.nodes)
+        start = time.perf_counter()
+        await request(reader, writer, message)
+        latencies[op].append(time.perf_counter()-start)
+    writer.close()
+
+async def loadgenerator(args):
+    latencies = {'load': [], 'fire': [], 'borrow': [], 'query': [], 'undo': []}
+    start = time.perf_counter()
+    await asyncio.gather(*(loadclient(args, n, args.sessions//args.connections, args.requests//args.connections, latencies)
+                           for n in range(args.connections)))
+    seconds = time.perf_counter()-start
+    total = sum(len(samples) for (op, samples) in latencies.items() if op!='load')
+    print('%d requests in %.2f s, %.0f requests/s over %d connections' % (total, seconds, total/seconds, args.connections))
+    for (op, samples) in latencies.items():
+        if not samples:
+           continue
+        samples.sort()
+        print('%-7s p50 %7.3f ms  p90 %7.3f ms  p99 %7.3f ms' % (op, samples[len(samples)//2]*1000,
+              samples[int(len(samples)*.9)]*1000, samples[min(len(samples)-1, int(len(samples)*.99))]*1000))
+
+def main():
+    parser = argparse.ArgumentParser(description='Dollar Game board server')
+    parser.add_argument('command', choices=['serve','load'], help='run the server or the load generator')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--unix', metavar='PATH', help='use a Unix socket instead of TCP')
+    parser.add_argument('--max-sessions', type=int, default=MAXSESSIONS)
+    parser.add_argument('--idle-timeout', type=float, default=IDLETIMEOUT)
+    parser.add_argument('--connections', type=int, default=50, help='load generator connections')
+    parser.add_argument('--sessions', type=int, default=1000, help='load generator sessions (spread over the connections)')
+    parser.add_argument('--requests', type=int, default=100000, help='load generator requests')
+    parser.add_argument('--nodes', type=int, default=16, help='nodes per load generator board')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    args.connections = max(1, min(args.connections, args.sessions))
+
+    if args.command=='serve':
+       server = Server(args.max_sessions, args.idle_timeout)
+       try:
+          asyncio.run(server.serve(args.host, args.port, args.unix))
+       except KeyboardInterrupt:
+          pass
+    else:
+       asyncio.run(loadgenerator(args))
+
+if __name__ == '__main__':
+    main()
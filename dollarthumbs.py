@@ -0,0 +1,94 @@
+"""
+Headless thumbnail renderer for Dollar Game boards (dollargame.py)
+
+Renders board files (any format boardio.py reads) to PNG images off-screen, drawn just like the game view draws
+its boards, without texts or highlights. The boards are spread over a pool of worker processes,
+each keeping its own fonts, background and board surfaces for all the boards it renders.
+
+   python dollarthumbs.py --out thumbs --size 320x240 --size 160x120 boards/*.json
+"""
+
+import os, sys, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# no window, no sound
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame as pg
+import dollargame as dg
+
+LAYOUTITERATIONS = 50 # force directed layout iterations for boards without positions
+GAMEFOLDER = os.path.dirname(os.path.abspath(dg.__file__)) # the game's background and fonts are found from here
+
+# per worker process: one view and one model (with its surfaces) per thumbnail size
+view = None
+models = {}
+
+# the workers run in the game folder, so board files and the output directory are given as absolute paths
+def initworker():
+    global view
+    os.chdir(GAMEFOLDER)
+    pg.init()
+    view = dg.View(display=False)
+
+def model(size):
+    if not size in models:
+       models[size] = dg.Model(size)
+    return models[size]
+
+# the whole file name is kept, so a.txt and a.graphml (or a.b.json and a.c.json) get thumbnails of their own
+def thumbnailname(outdir, filename, size):
+    return os.path.join(outdir, '%s.%dx%d.png' % (os.path.basename(filename), size[0], size[1]))
+
+# render one board file in all sizes, returns the written file names
+def render(job):
+    (filename, outdir, sizes, layoutiterations) = job
+    board = model(sizes[0])
+    dg.loadboard(board, filename)
+    if not board.layout is None:
+       board.layout = dg.Layout(board, bounds=board.layout.bounds, iterations=layoutiterations)
+       while not board.layout.done:
+           board.layout.step(board, 10)
+       board.layout = None
+    written = []
+    for size in sizes:
+        thumbnail = model(size)
+        if not thumbnail is board:
+           thumbnail.nodes = board.nodes
+           thumbnail.edges = board.edges
+           thumbnail.nodeidcounter = board.nodeidcounter
+           thumbnail.invalidate()
+        dg.fitcamera(thumbnail)
+        view.draw(thumbnail, 'thumbnail')
+        image = thumbnail.bg.copy()
+        image.blit(thumbnail.fg, (0,0))
+        written.append(thumbnailname(outdir, filename, size))
+        pg.image.save(image, written[-1])
+    return written
+
+def size(text):
+    (width, height) = text.lower().split('x')
+    return (int(width), int(height))
+
+def main():
+    parser = argparse.ArgumentParser(description='Render Dollar Game boards to PNG thumbnails')
+    parser.add_argument('boards', nargs='+', help='board files')
+    parser.add_argument('--out', default='thumbnails', help='output directory')
+    parser.add_argument('--size', type=size, action='append', help='thumbnail size as WIDTHxHEIGHT, can be given more than once (default 320x240)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--layout', type=int, default=LAYOUTITERATIONS, help='layout iterations for boards without positions')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    jobs = [(os.path.abspath(filename), os.path.abspath(args.out), args.size or [(320,240)], args.layout) for filename in args.boards]
+    start = time.perf_counter()
+    count = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=initworker) as pool:
+         for written in pool.map(render, jobs, chunksize=max(1, len(jobs)//(4*args.workers))):
+             count += len(written)
+    seconds = time.perf_counter()-start
+    print('%d thumbnails in %.1f s (%.0f per minute)' % (count, seconds, count*60/max(seconds, 1e-9)))
+
+if __name__ == '__main__':
+    main()
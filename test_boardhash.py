@@ -0,0 +1,66 @@
+"""
+Tests of the board fingerprints and the duplicate index (run with python -m pytest)
+"""
+
+from random import Random
+import boardhash
+
+# random board as model.nodes and model.edges
+def randomboard(seed, n=30):
+    rng = Random(seed)
+    nodes = {i: [(rng.randint(0, 1000), rng.randint(0, 1000)), rng.randint(-3, 3)] for i in range(n)}
+    edges = {(i-1, i) for i in range(1, n)}
+    edges |= {tuple(sorted(rng.sample(range(n), 2))) for i in range(n)}
+    return (nodes, edges)
+
+# the same board with other (sparse) node ids, moved nodes and the edges the other way round
+def relabel(nodes, edges, seed):
+    rng = Random(seed)
+    ids = rng.sample(range(10*len(nodes)), len(nodes))
+    newid = dict(zip(nodes, ids))
+    newnodes = {newid[nodeid]: [(rng.randint(0, 1000), rng.randint(0, 1000)), amount]
+                for (nodeid, (position, amount)) in nodes.items()}
+    newedges = {(newid[node2], newid[node1]) for (node1, node2) in edges}
+    return (newnodes, newedges)
+
+def test_fingerprint_ignores_node_ids():
+    for seed in range(20):
+        (nodes, edges) = randomboard(seed)
+        (othernodes, otheredges) = relabel(nodes, edges, seed)
+        assert boardhash.fingerprint(nodes, edges) == boardhash.fingerprint(othernodes, otheredges)
+        assert boardhash.isomorphic(boardhash.normalize(nodes, edges), boardhash.normalize(othernodes, otheredges))
+
+def test_fingerprint_tells_dollars_apart():
+    (nodes, edges) = randomboard(1)
+    before = boardhash.fingerprint(nodes, edges)
+    nodes[0][1] += 1
+    nodes[1][1] -= 1
+    assert boardhash.fingerprint(nodes, edges) != before
+
+# two triangles and a hexagon: every node has two neighbours, so colour refinement can't tell them apart
+def triangles():
+    nodes = {i: [(0,0), 1] for i in range(6)}
+    return (nodes, {(0,1), (1,2), (2,0), (3,4), (4,5), (5,3)})
+
+def hexagon():
+    nodes = {i: [(0,0), 1] for i in range(6)}
+    return (nodes, {(i, (i+1)%6) for i in range(6)})
+
+def test_isomorphic_rejects_equal_fingerprints():
+    assert boardhash.fingerprint(*triangles()) == boardhash.fingerprint(*hexagon())
+    assert not boardhash.isomorphic(boardhash.normalize(*triangles()), boardhash.normalize(*hexagon()))
+
+def test_boardindex(tmp_path):
+    with boardhash.BoardIndex(str(tmp_path/'boards.idx')) as index:
+         (nodes, edges) = randomboard(2)
+         assert index.add(nodes, edges)
+         assert not index.add(*relabel(nodes, edges, 3))
+         assert relabel(nodes, edges, 4) in index
+         # same fingerprint, different boards
+         assert index.add(*triangles())
+         assert not hexagon() in index
+         assert index.add(*hexagon())
+         assert not index.add(*relabel(*hexagon(), 5))
+    # kept between runs
+    with boardhash.BoardIndex(str(tmp_path/'boards.idx')) as index:
+         assert (nodes, edges) in index and triangles() in index and hexagon() in index
@@ -0,0 +1,53 @@
+"""
+Tests of reading and writing boards in every format (run with python -m pytest)
+"""
+
+import pytest
+import boardio
+
+# sparse node ids like after deleting nodes in the editor, node 7 without edges
+NODES = {0: [(10, 20), 3], 2: [(-5.5, 40), -2], 3: [(0, 0), 0], 5: [(100, -7.25), 1], 7: [(3, 4), -1]}
+EDGES = {(0, 2), (2, 3), (3, 5), (0, 5), (2, 5)}
+
+# the label each format gives a node id, in the order written
+LABELS = {
+    'edgelist': lambda i, nodeid: str(nodeid),
+    'dimacs'  : lambda i, nodeid: str(i+1),
+    'graphml' : lambda i, nodeid: 'n%d' % nodeid,
+    'json'    : lambda i, nodeid: str(nodeid),
+    'sav'     : lambda i, nodeid: nodeid
+}
+
+@pytest.mark.parametrize('name', ['board.txt', 'board.csv', 'board.txt.gz', 'board.dimacs', 'board.graphml',
+                                  'board.graphml.gz', 'board.json', 'board.jsonl.gz', 'board.sav'])
+def test_roundtrip(tmp_path, name):
+    filename = str(tmp_path/name)
+    fmt = boardio.formatof(filename)
+    boardio.write(filename, sorted(NODES.items()), EDGES)
+    board = boardio.read(filename)
+    assert len(board) == len(NODES)
+    ids = {nodeid: board.ids[LABELS[fmt](i, nodeid)] for (i, nodeid) in enumerate(sorted(NODES))}
+    assert board.edges == {(min(ids[node1], ids[node2]), max(ids[node1], ids[node2])) for (node1, node2) in EDGES}
+    for (nodeid, (position, amount)) in NODES.items():
+        if fmt=='edgelist':
+           # just the graph
+           assert board.positions[ids[nodeid]] is None and board.amounts[ids[nodeid]] == 0
+        else:
+           assert tuple(board.positions[ids[nodeid]]) == position and board.amounts[ids[nodeid]] == amount
+
+def test_missing_positions_stay_missing(tmp_path):
+    filename = str(tmp_path/'board.json')
+    boardio.write(filename, [(0, [None, 1]), (1, [(5, 6), 2])], {(0, 1)})
+    board = boardio.read(filename)
+    assert board.positions == [None, (5, 6)] and board.amounts == [1, 2]
+
+def test_edgelist_drops_self_loops_and_multiple_edges(tmp_path):
+    filename = tmp_path/'board.txt'
+    filename.write_text('# comment\n% comment\na b 1.5\nb a\nb,b\nc d\ne\n')
+    board = boardio.read(str(filename))
+    assert board.ids == {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4}
+    assert board.edges == {(0, 1), (2, 3)}
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+         boardio.read('board.xyz')
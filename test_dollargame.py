@@ -0,0 +1,466 @@
+"""
+Tests of the game model (run with python -m pytest)
+"""
+
+import os, pickle
+from random import Random
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import numpy as np
+import pytest
+import dollargame as dg
+
+# the model loads its background relative to the game folder
+@pytest.fixture(autouse=True)
+def gamefolder(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+# a connected random board of n nodes scattered over size*size, with dollars from low to high
+def randomboard(seed, n, size=2000, low=-3, high=3, compact=False):
+    rng = Random(seed)
+    model = dg.Model()
+    positions = [(rng.uniform(0, size), rng.uniform(0, size)) for i in range(n)]
+    amounts = [rng.randint(low, high) for i in range(n)]
+    edges = {(i-1, i) for i in range(1, n)}
+    edges |= {tuple(sorted(rng.sample(range(n), 2))) for i in range(n//2)}
+    if compact:
+       u = np.array([edge[0] for edge in edges])
+       v = np.array([edge[1] for edge in edges])
+       model.nodes = dg.CompactNodes(positions, amounts)
+       model.edges = dg.CompactEdges(n, u, v)
+    else:
+       model.nodes = {i: [positions[i], amounts[i]] for i in range(n)}
+       model.edges = edges
+    model.nodeidcounter = n
+    model.invalidate()
+    return model
+
+###### compact boards
+
+def test_compactedges_like_a_set():
+    rng = Random(1)
+    n = 50
+    edges = {tuple(sorted(rng.sample(range(n), 2))) for i in range(100)}
+    compact = dg.CompactEdges(n, np.array([edge[0] for edge in edges]), np.array([edge[1] for edge in edges]))
+    for step in range(2000):
+        edge = tuple(rng.sample(range(n), 2))
+        key = (min(edge), max(edge))
+        if rng.random()<0.5:
+           compact.add(edge)
+           edges.add(key)
+        else:
+           compact.discard(edge)
+           edges.discard(key)
+        assert (edge in compact) == (key in edges)
+        assert len(compact) == len(edges)
+    assert set(compact) == edges
+    assert all(edge in compact for edge in edges)
+    assert all((edge[1], edge[0]) in compact for edge in edges)
+    (u, v) = compact.arrays()
+    assert set(zip(u.tolist(), v.tolist())) == edges
+    # pickled (saved, recorded) it turns into a plain set
+    copy = pickle.loads(pickle.dumps(compact))
+    assert type(copy) is set and copy == edges
+
+def test_compactnodes_like_a_dict():
+    nodes = dg.CompactNodes([(0,0), (1,2), (3,4)], [1, -2, 3])
+    nodes[5] = [(5,6), 7]
+    del nodes[1]
+    assert list(nodes) == [0, 2, 5]
+    assert not 1 in nodes and not 4 in nodes
+    assert list(nodes[5]) == [(5,6), 7]
+    nodes[2][1] = -1
+    nodes.setpositions(np.array([0, 5]), np.array([[10,11], [12,13]]))
+    assert pickle.loads(pickle.dumps(nodes)) == {0: [(10,11), 1], 2: [(3,4), -1], 5: [(12,13), 7]}
+
+###### firing scripts
+
+def test_laplacian_like_the_matrix():
+    model = randomboard(7, 30)
+    matrix = np.zeros((30, 30), dtype=np.int64)
+    for (node1, node2) in model.edges:
+        matrix[node1, node2] -= 1
+        matrix[node2, node1] -= 1
+        matrix[node1, node1] += 1
+        matrix[node2, node2] += 1
+    x = np.array(Random(8).choices(range(-5, 6), k=30))
+    assert (dg.Laplacian(model) @ x).tolist() == (matrix @ x).tolist()
+
+def test_fire_like_clicks():
+    model = randomboard(9, 25, compact=True)
+    clicked = randomboard(9, 25, compact=True)
+    hints = dg.Hints(clicked)
+    firing = {3: 2, 7: -1, 12: 4}
+    for (nodeid, times) in firing.items():
+        for click in range(abs(times)):
+            hints.fire(clicked, nodeid, 1 if times>0 else -1)
+    dg.fire(model, firing)
+    assert model.nodes.amounts.tolist() == clicked.nodes.amounts.tolist()
+    # the same as a list indexed by node id
+    dg.fire(model, [-firing.get(nodeid, 0) for nodeid in range(25)])
+    assert model.nodes.amounts.tolist() == randomboard(9, 25, compact=True).nodes.amounts.tolist()
+
+def test_fire_is_exact_beyond_float():
+    model = dg.Model()
+    model.nodes = {0: [(0,0), 0], 1: [(100,0), 0]}
+    model.edges = {(0,1)}
+    model.nodeidcounter = 2
+    dg.fire(model, {0: 2**60+1})
+    assert (model.nodes[0][1], model.nodes[1][1]) == (-2**60-1, 2**60+1)
+    with pytest.raises(ValueError):
+         dg.fire(model, {0: 2**62})
+
+@pytest.mark.parametrize('firing', [{0: 1.5}, {0: '1'}, {0: 2**70}, {5: 1}, [1.5, 0, 0], [0, np.nan, 0], [1, 2]])
+def test_invalid_firing_scripts(firing):
+    model = randomboard(10, 3)
+    with pytest.raises(ValueError):
+         dg.firingvector(model, firing)
+
+def test_whole_float_counts():
+    model = randomboard(11, 3)
+    assert dg.firingvector(model, {1: 2.0}).tolist() == dg.firingvector(model, [0, 2.0, 0]).tolist() == [0, 2, 0]
+
+###### spatial index
+
+# whether the bounding box of the edge from a to b overlaps rect (x1,y1,x2,y2)
+def overlaps(a, b, rect):
+    return min(a[0],b[0])<=rect[2] and rect[0]<=max(a[0],b[0]) and min(a[1],b[1])<=rect[3] and rect[1]<=max(a[1],b[1])
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_spatialindex_against_all_nodes(compact):
+    # spread wide, so many edges span more than MAXEDGECELLS cells
+    model = randomboard(2, 400, size=20000, compact=compact)
+    index = model.spatialindex()
+    nodes = {nodeid: node[0] for (nodeid, node) in model.nodes.items()}
+    rng = Random(3)
+    for query in range(50):
+        (x, y) = (rng.uniform(-1000, 21000), rng.uniform(-1000, 21000))
+        rect = (x, y, x+rng.uniform(0, 5000), y+rng.uniform(0, 5000))
+        assert set(index.nodes(rect)) == {nodeid for (nodeid, (px,py)) in nodes.items()
+                                          if rect[0]<=px<=rect[2] and rect[1]<=py<=rect[3]}
+        edges = index.edges(rect)
+        assert edges >= {edge for edge in model.edges if overlaps(nodes[edge[0]], nodes[edge[1]], rect)}
+        # short edges come by their cells, so a few more within a cell of rect
+        near = (rect[0]-index.cellsize, rect[1]-index.cellsize, rect[2]+index.cellsize, rect[3]+index.cellsize)
+        assert all(overlaps(nodes[edge[0]], nodes[edge[1]], near) for edge in edges)
+        radius = rng.uniform(10, 2000)
+        distances = sorted(((px-x)**2+(py-y)**2, nodeid) for (nodeid, (px,py)) in nodes.items())
+        nearest = index.nearest((x,y), radius)
+        if distances[0][0]<radius**2:
+           assert nearest == distances[0][1]
+        else:
+           assert nearest == -1
+        nearby = index.ids[index.nearby((x,y), 20)].tolist()
+        assert sorted(nearby) == sorted(nodeid for (distance, nodeid) in distances[:20])
+    assert index.degree.tolist()[:len(nodes)] == [sum(nodeid in edge for edge in model.edges) for nodeid in range(len(nodes))]
+
+###### geometry kernel
+
+def test_vec2darray_like_the_scalar_kernel():
+    rng = Random(5)
+    points = [(rng.randint(0, 100), rng.randint(0, 100)) for i in range(50)]+[(7, 7), (7, 7)]
+    array = dg.Vec2dArray(points)
+    assert len(array) == len(points) and array[3] == points[3]
+    assert dg.Vec2dArray.fromarray(np.array(points)).x.tolist() == array.x.tolist()
+    point = (40.5, 60.25)
+    assert array.dist_sqrd(point).tolist() == [dg.dist_sqrd(x, y, *point) for (x, y) in points]
+    assert array.dist_sqrd(point, np.array([4, 2])).tolist() == [dg.dist_sqrd(*points[4], *point), dg.dist_sqrd(*points[2], *point)]
+    buffer = np.empty(len(points))
+    for index in range(len(points)):
+        for start in (0, index+1):
+            distances = array.segment_dist_sqrd(point, index, start, out=buffer[start:])
+            assert distances.tolist() == [dg.segment_dist_sqrd(*point, *points[index], *end) for end in points[start:]]
+    # the last two points are the same, no segment between them
+    assert array.segment_dist_sqrd((7, 7), len(points)-2).tolist()[-1] == np.inf
+
+# nearest edge of all node pairs, existing or not
+def nearestpair(model, pos):
+    (mindistance, nearest) = ((dg.CIRCLESIZE/2)**2, None)
+    ids = sorted(model.nodes)
+    for (i, node1) in enumerate(ids):
+        for node2 in ids[i+1:]:
+            distance = dg.segment_dist_sqrd(*pos, *model.nodes[node1][0], *model.nodes[node2][0])
+            if mindistance>distance:
+               (mindistance, nearest) = (distance, (node1, node2))
+    return (nearest, mindistance**.5)
+
+def test_nearest_edge_like_all_pairs():
+    editor = dg.Editor()
+    rng = Random(6)
+    for board in range(100):
+        # fewer nodes than EDGECANDIDATES, so all pairs are candidates
+        model = randomboard(board, rng.randint(2, 40), size=600)
+        pos = (rng.uniform(0, 600), rng.uniform(0, 600))
+        (edge, distance) = editor.nearestedge(model, pos)
+        (expected, expecteddistance) = nearestpair(model, pos)
+        assert distance == pytest.approx(expecteddistance)
+        assert (edge is None) == (expected is None)
+        if not edge is None:
+           assert sorted(edge) == list(expected)
+           # existing edges come as they are kept, so a click removes them
+           assert edge in model.edges or not (edge[1], edge[0]) in model.edges
+
+###### camera
+
+def test_camera_round_trip():
+    camera = dg.Camera((800, 600))
+    camera.fit((-5000, 200, 3000, 4000))
+    for zoom in [dg.MINZOOM, 0.3, 1, dg.MAXZOOM]:
+        camera.zoomat((400, 300), zoom/camera.zoom)
+        for pos in [(0, 0), (123, 456), (799, 599)]:
+            (x, y) = camera.toscreen(camera.toworld(pos))
+            # toworld truncates to whole world units, which are up to MAXZOOM pixels apart
+            assert abs(x-pos[0]) <= max(1, zoom) and abs(y-pos[1]) <= max(1, zoom)
+
+def test_camera_fit_shows_the_rectangle():
+    camera = dg.Camera((800, 600))
+    rect = (-5000, 200, 3000, 4000)
+    camera.fit(rect)
+    viewport = camera.viewport()
+    assert viewport[0] <= rect[0] and viewport[1] <= rect[1] and viewport[2] >= rect[2] and viewport[3] >= rect[3]
+    # as large as possible: the wider side fills the screen
+    assert viewport[2]-viewport[0] == pytest.approx(rect[2]-rect[0])
+    # margins widen the viewport on every side
+    assert camera.viewport(10) == pytest.approx((viewport[0]-10, viewport[1]-10, viewport[2]+10, viewport[3]+10))
+    # a tiny rectangle is shown at the largest zoom
+    camera.fit((10, 10, 11, 11))
+    assert camera.zoom == dg.MAXZOOM
+
+def test_camera_zoom_keeps_the_mouse_position():
+    camera = dg.Camera((800, 600))
+    camera.pan((-250, 70))
+    world = camera.toworld((321, 123))
+    for factor in [dg.ZOOMSTEP]*20+[1/dg.ZOOMSTEP]*60:
+        camera.zoomat((321, 123), factor)
+        assert dg.MINZOOM <= camera.zoom <= dg.MAXZOOM
+        assert camera.toworld((321, 123)) == pytest.approx(world, abs=1)
+    assert camera.zoom == dg.MINZOOM
+
+def test_camera_pan_follows_the_mouse():
+    camera = dg.Camera((800, 600))
+    camera.zoomat((0, 0), 2)
+    world = camera.toworld((100, 100))
+    camera.pan((40, -30))
+    assert camera.toscreen(world) == pytest.approx((140, 70), abs=1)
+
+def test_loaded_board_fits_the_screen(tmp_path):
+    model = randomboard(4, 300, size=100000)
+    boardfile = tmp_path/'board.txt'
+    dg.saveboard(model, str(boardfile))
+    model = dg.Model()
+    dg.loadboard(model, str(boardfile))
+    (left, top, right, bottom) = model.camera.viewport()
+    for (pos, amount) in model.nodes.values():
+        assert left <= pos[0] <= right and top <= pos[1] <= bottom
+
+###### hints
+
+def solvable(model):
+    genus = len(model.edges)-len(model.nodes)+1
+    dollars = dg.dollarsum(model)
+    # at least genus dollars make any connected board solvable
+    if dollars<genus:
+       model.nodes[0][1] += genus-dollars
+    return model
+
+@pytest.mark.parametrize('seed', range(40))
+def test_following_hints_solves(seed):
+    rng = Random(seed)
+    model = solvable(randomboard(seed, rng.randint(2, 40), low=-5, high=5, compact=seed%2==1))
+    hints = dg.Hints(model)
+    moves = 0
+    while True:
+        hint = hints.hint()
+        if hint is None:
+           break
+        hints.fire(model, *hint)
+        moves += 1
+        assert moves<100000, 'hints keep going'
+    assert not hints.unsolvable
+    assert all(node[1]>=0 for node in model.nodes.values())
+    # the hints' own amounts are the board's
+    assert hints.amounts.tolist() == [model.nodes[nodeid][1] for nodeid in range(model.nodeidcounter)]
+
+def test_hints_give_up_on_unsolvable_boards():
+    # less than no dollars in total, and moves don't change the total
+    model = randomboard(4, 20, low=-3, high=0)
+    model.nodes[0][1] = -1
+    hints = dg.Hints(model)
+    assert hints.unsolvable and hints.hint() is None
+
+def test_hints_find_an_unsolvable_board_by_borrowing():
+    # -1, 1 and 0 dollars on a triangle only ever turn round, though the total isn't in debt
+    model = dg.Model()
+    model.nodes = {0: [(0,0), -1], 1: [(100,0), 1], 2: [(0,100), 0]}
+    model.edges = {(0,1), (1,2), (0,2)}
+    model.nodeidcounter = 3
+    hints = dg.Hints(model)
+    for move in range(100):
+        hint = hints.hint()
+        if hint is None:
+           break
+        hints.fire(model, *hint)
+    assert hints.unsolvable and hints.hint() is None
+
+###### layout
+
+def test_layout_settles_within_bounds():
+    model = randomboard(6, 150)
+    # a dragged node stays where it is, even out of bounds
+    model.dragnodeindex = 0
+    pinned = tuple(int(c) for c in model.nodes[0][0]) # positions are whole pixels after a step
+    layout = dg.Layout(model, bounds=(100, 100, 900, 900), iterations=60)
+    for step in range(100):
+        if layout.done:
+           break
+        layout.step(model, 3)
+    assert layout.done
+    assert tuple(model.nodes[0][0]) == pinned
+    pos = dg.positionsof(model, np.arange(1, 150))
+    assert (pos>=100).all() and (pos<=900).all()
+    # neighbours end up closer to each other than the nodes are on average
+    pos = dg.positionsof(model, np.arange(150))
+    (u, v) = dg.edgearrays(model)
+    d = pos[:,None,:]-pos[None,:,:]
+    assert np.hypot(*(pos[u]-pos[v]).T).mean() < np.sqrt((d*d).sum(axis=2)).mean()/2
+
+def test_layout_repulsion_like_all_pairs(monkeypatch):
+    model = randomboard(2, 400)
+    layout = dg.Layout(model, bounds=(0, 0, 2000, 2000))
+    pos = dg.positionsof(model, layout.ids)
+    approximated = layout.repulsion(pos)
+    monkeypatch.setattr(dg, 'DIRECTREPULSIONNODES', 1000)
+    exact = layout.repulsion(pos)
+    assert np.hypot(*(approximated-exact).T).sum() < np.hypot(*exact.T).sum()*0.05
+
+def test_layout_after_replacing_a_node():
+    model = dg.Model()
+    model.nodes = {0: [(100, 100), 1], 1: [(200, 100), 0], 2: [(300, 100), -1]}
+    model.edges = {(0, 1), (1, 2)}
+    model.nodeidcounter = 3
+    model.invalidate()
+    layout = dg.Layout(model, bounds=(0, 0, 500, 500))
+    layout.step(model)
+    # as many nodes and edges as before, but others
+    del model.nodes[2]
+    model.edges.discard((1, 2))
+    model.nodes[3] = [(300, 300), -1]
+    model.edges.add((1, 3))
+    model.nodeidcounter = 4
+    model.invalidate()
+    layout.step(model)
+    assert layout.ids.tolist() == [0, 1, 3]
+    assert sorted(zip(layout.u.tolist(), layout.v.tolist())) == [(0, 1), (1, 2)]
+
+###### selection
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_selection_transforms(compact):
+    model = randomboard(8, 60, compact=compact)
+    before = dg.positionsof(model, np.arange(60))
+    members = list(range(10, 30))
+    selection = dg.Selection(members)
+    changes = model.changes
+
+    selection.grab(model, 'move', (500, 500))
+    selection.drag((510, 480))
+    # only the latest mouse position counts
+    selection.drag((530, 540))
+    selection.release(model)
+    moved = dg.positionsof(model, np.arange(60))
+    assert np.abs(moved[members]-(before[members]+(30, 40))).max() <= 1
+    assert model.changes > changes
+
+    # twice as far from the center, as the mouse
+    newcenter = moved[members].mean(axis=0)
+    selection.grab(model, 'scale', tuple(newcenter+(100, 0)))
+    selection.drag(tuple(newcenter+(0, 200)))
+    selection.step(model)
+    scaled = dg.positionsof(model, np.arange(60))
+    assert np.abs(scaled[members]-(newcenter+(moved[members]-newcenter)*2)).max() <= 2
+
+    # a quarter turn around the center
+    selection.grab(model, 'rotate', tuple(newcenter+(100, 0)))
+    selection.drag(tuple(newcenter+(0, 100)))
+    selection.step(model)
+    rotated = dg.positionsof(model, np.arange(60))
+    (dx, dy) = (scaled[members]-newcenter).T
+    assert np.abs(rotated[members]-(newcenter+np.column_stack([-dy, dx]))).max() <= 2
+
+    others = [i for i in range(60) if not i in selection]
+    assert (rotated[others] == before[others]).all()
+
+def test_selection_forgets_deleted_nodes():
+    model = randomboard(9, 20)
+    selection = dg.Selection([1, 2, 3])
+    del model.nodes[2]
+    model.invalidate()
+    selection.grab(model, 'move', (0, 0))
+    assert len(selection) == 2 and not 2 in selection
+
+def test_select_and_drag_in_the_editor():
+    app = dg.Controller()
+    model = app.model
+    model.nodes = {0: [(100, 100), 1], 1: [(200, 100), -1], 2: [(100, 200), 0], 3: [(600, 500), 0]}
+    model.edges = {(0, 1), (1, 2), (2, 3)}
+    model.nodeidcounter = 4
+    model.invalidate()
+    app.setup_states(states(), 'editor')
+    left = (1, 0, 0)
+    motion = lambda pos, buttons=(0, 0, 0): dg.pg.event.Event(dg.pg.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=buttons)
+    button = lambda kind, pos: dg.pg.event.Event(kind, pos=pos, button=1)
+    key = lambda kind: dg.pg.event.Event(kind, key=dg.pg.K_LSHIFT, mod=0, unicode='', scancode=0)
+    # shift drag a rectangle around the first three nodes
+    for event in [key(dg.pg.KEYDOWN), motion((50, 50)), button(dg.pg.MOUSEBUTTONDOWN, (50, 50)),
+                  motion((250, 250), left), button(dg.pg.MOUSEBUTTONUP, (250, 250)), key(dg.pg.KEYUP)]:
+        app.doevent(event)
+        app.update()
+    assert set(model.selection.members) == {0, 1, 2}
+    # dragging one of them moves all of them
+    for event in [motion((100, 100)), button(dg.pg.MOUSEBUTTONDOWN, (100, 100)),
+                  motion((120, 120), left), motion((130, 140), left), button(dg.pg.MOUSEBUTTONUP, (130, 140))]:
+        app.doevent(event)
+        app.update()
+    assert boardof(model)[0] == {0: ((130, 140), 1), 1: ((230, 140), -1), 2: ((130, 240), 0), 3: ((600, 500), 0)}
+
+###### recording and replaying
+
+# input of a session: the mouse moves across the board and clicks now and then
+def sessionevents(frames):
+    for frame in range(frames):
+        pos = (200+frame*5, 300+frame%7*20)
+        events = [dg.pg.event.Event(dg.pg.MOUSEMOTION, pos=pos, rel=(5, 0), buttons=(0, 0, 0))]
+        if frame%15==7:
+           events.append(dg.pg.event.Event(dg.pg.MOUSEBUTTONDOWN, pos=pos, button=1))
+           events.append(dg.pg.event.Event(dg.pg.MOUSEBUTTONUP, pos=pos, button=1))
+        yield events
+
+def states():
+    return {'title': dg.Title(), 'editor': dg.Editor(), 'game': dg.Game()}
+
+def boardof(model):
+    return ({nodeid: (tuple(node[0]), node[1]) for (nodeid, node) in model.nodes.items()}, set(model.edges))
+
+def test_replay_of_a_loaded_board(tmp_path):
+    # a ring without positions, so loading starts a layout that keeps running while recording
+    boardfile = tmp_path/'ring.txt'
+    boardfile.write_text(''.join('%d %d\n' % (i, (i+1)%30) for i in range(30))+'0 15\n3 20\n')
+    app = dg.Controller()
+    dg.loadboard(app.model, str(boardfile))
+    assert not app.model.layout is None
+    app.recorder = dg.Recorder(str(tmp_path/'session.rec'), app.model, 'editor', seed=5)
+    app.setup_states(states(), 'editor')
+    for events in sessionevents(120):
+        app.recorder.frame(events)
+        for event in events:
+            app.doevent(event)
+        app.update()
+    app.recorder.close()
+    recorded = boardof(app.model)
+
+    app = dg.Controller()
+    replay = dg.Replay(str(tmp_path/'session.rec'))
+    replay.setup(app.model)
+    app.setup_states(states(), replay.header['state'])
+    app.replay_event_loop(replay, fast=True)
+    replay.close()
+    assert boardof(app.model) == recorded
@@ -0,0 +1,82 @@
+"""
+Tests of the board server sessions and requests (run with python -m pytest)
+"""
+
+import pytest
+from dollarserver import Server, Session
+
+# the triangle of the protocol example
+DOLLARS = [-2, 1, 3]
+EDGES = [[0,1], [1,2], [2,0]]
+
+def test_fire_and_undo():
+    session = Session(DOLLARS, EDGES)
+    session.play(2, 1)
+    assert session.dollars == [-1, 2, 1] and session.moves == 1 and session.debts == 1
+    session.play(0, -1)
+    assert session.dollars == [1, 1, 0] and session.debts == 0
+    session.undo()
+    session.undo()
+    assert session.dollars == DOLLARS and session.moves == 0 and session.debts == 1
+    with pytest.raises(ValueError):
+         session.undo()
+
+def test_fire_keeps_the_total():
+    session = Session([0, 0, 0, 0], [[0,1], [1,2], [2,3], [0,2], [0,1]])
+    for (node, amount) in [(0, 5), (3, -2), (2, 1), (0, -7)]:
+        session.play(node, amount)
+        assert sum(session.dollars) == 0
+    # node 0 has the edge to node 1 twice
+    assert session.query()['genus'] == 2
+
+def test_invalid_boards():
+    with pytest.raises(ValueError):
+         Session([0, 0], [[0, 0]])
+    with pytest.raises(ValueError):
+         Session([0, 0], [[0, 2]])
+
+@pytest.mark.parametrize('board', [{'dollars': '12'}, {'dollars': [1.7, 0]}, {'dollars': [True, 0]}, {'dollars': [2**60, 0]},
+                                   {'dollars': {'0': 1}}, {'dollars': [0, 0], 'edges': [[0, '1']]},
+                                   {'dollars': [0, 0], 'edges': [[0, 1.0]]}, {'dollars': [0, 0], 'edges': [[0, 1, 2]]},
+                                   {'dollars': [0, 0], 'edges': [0, 1]}, {'dollars': [0, 0], 'edges': {'0': 1}}])
+def test_invalid_loads(board):
+    server = Server()
+    with pytest.raises(ValueError):
+         server.handle(dict(board, op='load'))
+    assert not server.sessions
+
+def test_requests():
+    server = Server()
+    sessionid = server.handle({'op': 'load', 'dollars': DOLLARS, 'edges': EDGES})['session']
+    assert server.handle({'op': 'fire', 'session': sessionid, 'node': 2}) == {'ok': True, 'solved': False}
+    assert server.handle({'op': 'borrow', 'session': sessionid, 'node': 0}) == {'ok': True, 'solved': True}
+    assert server.handle({'op': 'undo', 'session': sessionid}) == {'ok': True, 'solved': False}
+    query = server.handle({'op': 'query', 'session': sessionid})
+    assert query['dollars'] == [-1, 2, 1] and query['moves'] == 1 and query['genus'] == 1
+    assert server.handle({'op': 'close', 'session': sessionid}) == {'ok': True}
+    with pytest.raises(ValueError):
+         server.handle({'op': 'query', 'session': sessionid})
+
+@pytest.mark.parametrize('move', [{'node': 1e999}, {'node': 1.0}, {'node': True}, {'node': 3}, {'node': -1},
+                                   {'node': 0, 'times': 10**30}, {'node': 0, 'times': '1'}])
+def test_invalid_moves(move):
+    server = Server()
+    sessionid = server.handle({'op': 'load', 'dollars': DOLLARS, 'edges': EDGES})['session']
+    with pytest.raises(ValueError):
+         server.handle(dict(move, op='fire', session=sessionid))
+    assert server.handle({'op': 'query', 'session': sessionid})['dollars'] == DOLLARS
+
+def test_sessions_are_not_replaced():
+    server = Server()
+    first = server.handle({'op': 'load', 'dollars': DOLLARS, 'edges': EDGES})['session']
+    second = server.handle({'op': 'load', 'session': first, 'dollars': [0, 0], 'edges': [[0, 1]]})['session']
+    assert first != second
+    assert server.handle({'op': 'query', 'session': first})['dollars'] == DOLLARS
+
+def test_least_recently_used_sessions_are_evicted():
+    server = Server(maxsessions=2)
+    sessions = [server.handle({'op': 'load', 'dollars': DOLLARS, 'edges': EDGES})['session'] for i in range(2)]
+    server.handle({'op': 'query', 'session': sessions[0]})
+    server.handle({'op': 'load', 'dollars': DOLLARS, 'edges': EDGES})
+    assert sessions[0] in server.sessions and not sessions[1] in server.sessions
+    assert server.evicted == 1
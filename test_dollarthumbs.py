@@ -0,0 +1,18 @@
+"""
+Tests of the thumbnail renderer (run with python -m pytest)
+"""
+
+import os, sys, subprocess
+import dollarthumbs
+
+def test_thumbnailname_keeps_the_whole_file_name():
+    names = {dollarthumbs.thumbnailname('out', name, (320, 240)) for name in ('a.txt', 'a.graphml', 'a.b.json', 'a.c.json')}
+    assert len(names) == 4
+    assert dollarthumbs.thumbnailname('out', 'boards/a.json', (320, 240)) == os.path.join('out', 'a.json.320x240.png')
+
+def test_runs_from_any_directory(tmp_path):
+    (tmp_path/'ring.txt').write_text(''.join('%d %d\n' % (i, (i+1)%12) for i in range(12)))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dollarthumbs.py')
+    subprocess.run([sys.executable, script, '--out', 'thumbs', '--size', '64x48', '--size', '32x24', '--workers', '1', 'ring.txt'],
+                   cwd=str(tmp_path), check=True)
+    assert sorted(os.listdir(str(tmp_path/'thumbs'))) == ['ring.txt.32x24.png', 'ring.txt.64x48.png']